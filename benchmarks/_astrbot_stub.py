@@ -0,0 +1,104 @@
+"""在没有安装 AstrBot 的环境中加载插件，供压测和基准测试脚本使用
+
+只提供插件用到的最小接口：filter 装饰器、MessageChain、Star/Context/register、
+AstrBotConfig、logger，以及模拟的事件/请求/响应对象。
+"""
+import sys
+import types
+import importlib
+import importlib.util
+from pathlib import Path
+
+PLUGIN_DIR = Path(__file__).resolve().parent.parent
+PACKAGE_NAME = "favor_plugin"
+
+
+class _Filter:
+    """filter.on_llm_request() 等装饰器直接返回原函数"""
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: (lambda func: func)
+
+
+class _Logger:
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+class _Star:
+    def __init__(self, context=None):
+        self.context = context
+
+
+class StubEvent:
+    """模拟 AstrMessageEvent"""
+
+    def __init__(self, sender_id, unified_msg_origin="stub:GroupMessage:0"):
+        self.sender_id = str(sender_id)
+        self.unified_msg_origin = unified_msg_origin
+        self.stopped = False
+        self.sent = []  # 通过 send 发送的消息
+
+    def get_sender_id(self):
+        return self.sender_id
+
+    def stop_event(self):
+        self.stopped = True
+
+    def plain_result(self, text):
+        return text
+
+    async def send(self, chain):
+        self.sent.append(chain)
+
+
+class StubMessageChain(list):
+    """模拟 MessageChain"""
+
+    def message(self, text):
+        self.append(text)
+        return self
+
+
+class StubRequest:
+    """模拟 ProviderRequest"""
+
+    def __init__(self):
+        self.system_prompt = ""
+
+
+class StubResponse:
+    """模拟 LLMResponse"""
+
+    def __init__(self, completion_text, is_chunk=False):
+        self.completion_text = completion_text
+        self.is_chunk = is_chunk
+
+
+def _install_astrbot():
+    if "astrbot" in sys.modules:
+        return
+    modules = {name: types.ModuleType(name) for name in (
+        "astrbot", "astrbot.api", "astrbot.api.event", "astrbot.api.star", "astrbot.api.provider")}
+    modules["astrbot.api"].AstrBotConfig = dict
+    modules["astrbot.api"].logger = _Logger()
+    modules["astrbot.api.event"].filter = _Filter()
+    modules["astrbot.api.event"].AstrMessageEvent = StubEvent
+    modules["astrbot.api.event"].MessageChain = StubMessageChain
+    modules["astrbot.api.star"].Context = object
+    modules["astrbot.api.star"].Star = _Star
+    modules["astrbot.api.star"].register = lambda *args, **kwargs: (lambda cls: cls)
+    modules["astrbot.api.provider"].LLMResponse = StubResponse
+    modules["astrbot.api.provider"].ProviderRequest = StubRequest
+    sys.modules.update(modules)
+
+
+def load_plugin():
+    """以包的形式导入插件，返回 main 模块"""
+    _install_astrbot()
+    if PACKAGE_NAME not in sys.modules:
+        spec = importlib.util.spec_from_loader(PACKAGE_NAME, loader=None, is_package=True)
+        package = importlib.util.module_from_spec(spec)
+        package.__path__ = [str(PLUGIN_DIR)]
+        sys.modules[PACKAGE_NAME] = package
+    return importlib.import_module(f"{PACKAGE_NAME}.main")
@@ -0,0 +1,94 @@
+"""好感度标记解析与回复清理微基准
+
+对比三种实现：
+- 旧实现：逐个子串查找标记 + 每条清理规则一次 re.sub
+- 单一交替正则：标记与清理规则合并为一个正则，一次 sub 同时识别和清理
+- MarkerEngine：标记合并为一个交替正则，清理规则逐条预编译
+
+用法：
+    python benchmarks/bench_markers.py [--sizes 1024,4096,16384] [--number 2000]
+"""
+import os
+import re
+import sys
+import random
+import argparse
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _astrbot_stub import load_plugin  # noqa: E402
+
+CLEAN_PATTERNS = [r"【.*?】", r"\[好感度.*?\]"]
+MARKERS = ["[好感度上升]", "[好感度大幅上升]", "[好感度大幅下降]", "[好感度下降]", "[好感度持平]"]
+
+
+def legacy(text: str):
+    """旧实现：四次子串查找 + 逐条 re.sub"""
+    marker = None
+    for candidate in MARKERS[:4]:
+        if candidate in text:
+            marker = candidate
+            break
+    cleaned = text
+    for pattern in CLEAN_PATTERNS:
+        cleaned = re.sub(pattern, "", cleaned)
+    return marker, cleaned.strip()
+
+
+def build_single_alternation():
+    """标记与清理规则合并为一个交替正则的实现"""
+    marker_alt = "|".join(re.escape(m) for m in sorted(MARKERS[:4], key=len, reverse=True))
+    combined = re.compile("|".join(f"(?:{p})" for p in CLEAN_PATTERNS) + f"|(?P<marker>{marker_alt})")
+    marker_re = re.compile(marker_alt)
+    priority = {m: i for i, m in enumerate(MARKERS[:4])}
+
+    def run(text: str):
+        found = set()
+
+        def replace(match):
+            if match.group("marker") is not None:
+                found.add(match.group("marker"))
+                return match.group(0)
+            found.update(marker_re.findall(match.group(0)))
+            return ""
+
+        cleaned = combined.sub(replace, text)
+        return (min(found, key=priority.__getitem__) if found else None), cleaned.strip()
+
+    return run
+
+
+def make_completion(size: int, rng: random.Random) -> str:
+    words = ["今天天气不错", "我们聊聊吧", "这个问题很有意思", "【微笑】", "哈哈", "好的呀", "嗯嗯"]
+    parts, length = [], 0
+    while length < size:
+        word = rng.choice(words)
+        parts.append(word)
+        length += len(word.encode("utf-8"))
+    parts.append(rng.choice(MARKERS))
+    return "".join(parts)
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1024,4096,16384")
+    parser.add_argument("--number", type=int, default=2000)
+    args = parser.parse_args()
+
+    main = load_plugin()
+    markers = sys.modules[main.__package__ + ".markers"]
+    engine = markers.MarkerEngine(markers.DEFAULT_FAVOR_MARKERS, CLEAN_PATTERNS)
+    rng = random.Random(0)
+
+    single = build_single_alternation()
+    print(f"{'大小(字节)':>10} {'旧实现(us)':>12} {'单一交替(us)':>14} {'预编译(us)':>12} {'加速':>6}")
+    for size in (int(x) for x in args.sizes.split(",")):
+        text = make_completion(size, rng)
+        assert legacy(text) == engine.process(text, True) == single(text), "实现结果不一致"
+        old = timeit.timeit(lambda: legacy(text), number=args.number) / args.number * 1e6
+        alt = timeit.timeit(lambda: single(text), number=args.number) / args.number * 1e6
+        new = timeit.timeit(lambda: engine.process(text, True), number=args.number) / args.number * 1e6
+        print(f"{size:>10} {old:>12.1f} {alt:>14.1f} {new:>12.1f} {old / new:>5.1f}x")
+
+if __name__ == "__main__":
+    main_cli()
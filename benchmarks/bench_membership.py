@@ -0,0 +1,53 @@
+"""黑名单检查基准
+
+对比普通/紧凑内存模式下、是否启用黑名单布隆过滤器（blacklist_bloom_filter）时
+is_blacklisted 的单次耗时，分别测量不在名单中（绝大多数请求）和在名单中的用户。
+
+用法：
+    python benchmarks/bench_membership.py [--entries 1000000] [--number 200000]
+"""
+import os
+import sys
+import random
+import argparse
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _astrbot_stub import load_plugin  # noqa: E402
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=1000000)
+    parser.add_argument("--number", type=int, default=200000)
+    args = parser.parse_args()
+
+    main = load_plugin()
+    membership = sys.modules[main.__package__ + ".membership"]
+    rng = random.Random(0)
+    ids = rng.sample(range(10000, 3999999999), args.entries * 2)
+    listed = {str(uid): {"timestamp": 1.7e9, "auto_added": False} for uid in ids[:args.entries]}
+    members = [str(uid) for uid in rng.sample(ids[:args.entries], 1000)]
+    others = [str(uid) for uid in rng.sample(ids[args.entries:], 1000)]
+
+    print(f"{'模式':<14} {'过滤器':>6} {'不在名单(ns)':>13} {'在名单(ns)':>11} {'误判率':>7}")
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        for compact in (False, True):
+            manager = main.FavorManager({"compact_memory": compact})
+            manager.blacklist = manager._wrap("blacklist", listed)
+            for use_filter in (False, True):
+                manager._blacklist_filter = membership.MembershipFilter(manager._blacklist_members) if use_filter else None
+                assert all(manager.is_blacklisted(u) for u in members) and not any(manager.is_blacklisted(u) for u in others)
+                miss = timeit.timeit(lambda: [manager.is_blacklisted(u) for u in others],
+                                     number=args.number // 1000) / args.number * 1e9
+                hit = timeit.timeit(lambda: [manager.is_blacklisted(u) for u in members],
+                                    number=args.number // 1000) / args.number * 1e9
+                fp = sum(u in manager._blacklist_filter for u in others) / len(others) if use_filter else 0.0
+                print(f"{'紧凑' if compact else '普通':<14} {'是' if use_filter else '否':>6} {miss:>13.0f} {hit:>11.0f} {fp:>7.1%}")
+            manager.close()
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,84 @@
+"""紧凑内存表示基准
+
+分别用嵌套 dict 和紧凑映射存放相同的会话好感度、会话计数器、会话黑名单数据（默认各 100 万条），
+数据先序列化为 JSON 再加载，与插件从文件加载时的对象共享情况一致。
+输出每类数据的内存占用（tracemalloc）和单次读取耗时。
+
+用法：
+    python benchmarks/bench_memory.py [--entries 1000000] [--sessions 1000] [--users 200000]
+"""
+import gc
+import os
+import sys
+import json
+import random
+import argparse
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _astrbot_stub import load_plugin  # noqa: E402
+
+
+def make_store(kind: str, entries: int, sessions: int, user_ids: list, rng: random.Random) -> str:
+    """生成一类会话数据的 JSON 文本"""
+    data = {}
+    per_session = entries // sessions
+    for s in range(sessions):
+        users = rng.sample(user_ids, per_session)
+        if kind == "session_favor_data":
+            data[f"aiocqhttp:GroupMessage:{700000000 + s}"] = {u: rng.randint(-30, 149) for u in users}
+        elif kind == "session_low_counter":
+            data[f"aiocqhttp:GroupMessage:{700000000 + s}"] = {u: rng.randint(0, 5) for u in users}
+        else:
+            data[f"aiocqhttp:GroupMessage:{700000000 + s}"] = {
+                u: {"timestamp": 1.7e9 + rng.random() * 1e6, "auto_added": rng.random() < 0.5} for u in users}
+    return json.dumps(data)
+
+
+def measure(build):
+    """返回 build() 结果占用的内存（字节）及结果本身"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return size, result
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=1000000)
+    parser.add_argument("--sessions", type=int, default=1000)
+    parser.add_argument("--users", type=int, default=200000)
+    parser.add_argument("--number", type=int, default=100000)
+    args = parser.parse_args()
+
+    main = load_plugin()
+    compact = sys.modules[main.__package__ + ".compact"]
+    rng = random.Random(0)
+    user_ids = [str(rng.randint(10000, 3999999999)) for _ in range(args.users)]
+
+    print(f"{'数据类型':<22} {'dict(MB)':>10} {'紧凑(MB)':>10} {'缩减':>6} {'dict读取(ns)':>13} {'紧凑读取(ns)':>13}")
+    for kind in ("session_favor_data", "session_low_counter", "session_blacklist"):
+        text = make_store(kind, args.entries, args.sessions, user_ids, rng)
+        plain_size, plain = measure(lambda: json.loads(text))
+        ids = compact.IdTable()
+        codec = compact.COMPACT_CODECS[kind]
+        compact_size, packed = measure(lambda: compact.CompactSessionMap(ids, codec, json.loads(text)))
+        assert {s: dict(u) for s, u in packed.items()} == plain, "紧凑表示与原数据不一致"
+
+        probes = [(s, rng.choice(list(users))) for s, users in rng.sample(list(plain.items()), 100)]
+        plain_ns = timeit.timeit(lambda: [plain.get(s, {}).get(u, 0) for s, u in probes],
+                                 number=args.number // 100) / args.number * 1e9
+        compact_ns = timeit.timeit(lambda: [packed.get(s, {}).get(u, 0) for s, u in probes],
+                                   number=args.number // 100) / args.number * 1e9
+        print(f"{kind:<22} {plain_size / 2**20:>10.1f} {compact_size / 2**20:>10.1f} "
+              f"{plain_size / compact_size:>5.1f}x {plain_ns:>13.0f} {compact_ns:>13.0f}")
+        del plain, packed
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,332 @@
+"""FavorPlugin 负载模拟基准
+
+在模拟的 astrbot 事件/请求/响应对象下运行 LLM 请求/响应钩子，模拟真实使用：
+- N 个用户分布在 M 个会话中，消息数按 Zipf 分布（少数活跃用户贡献大部分消息），
+  每个用户多数时候在自己所在的会话发言
+- 回复中的好感度标记按 --markers 给定的比例抽取
+- 按 --blacklist-churn 给定的比例插入管理员拉黑/解除拉黑指令
+- 场景对应配置中的会话独立开关：global 全部全局，session 全部按会话，mixed 仅好感度按会话
+
+每个场景在独立的子进程和临时数据目录中运行，输出吞吐量、两个钩子的 p50/p99 延迟、
+写入字节数和峰值 RSS。结果写入 JSON 文件（--output），--compare 指定上一次的结果文件时
+逐项输出变化比例，用于升级前后对比。
+
+用法：
+    python benchmarks/bench_workload.py [--backend json|sqlite|journal] [--scenarios global,session,mixed]
+        [--users 5000] [--sessions 50] [--messages 20000] [--concurrency 8] [--blacklist-churn 0.002]
+        [--markers 上升:0.4,大幅上升:0.05,下降:0.15,大幅下降:0.05,持平:0.25,无:0.1]
+        [--set compact_memory=true ...] [--seed 0] [--output bench_results.json] [--compare old.json]
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+import multiprocessing
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _astrbot_stub import load_plugin, StubEvent, StubRequest, StubResponse  # noqa: E402
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+RESULTS_VERSION = 1
+ADMIN_ID = "10000"
+SCENARIOS = {
+    "global": {"session_based_favor": False, "session_based_blacklist": False, "session_based_counter": False},
+    "session": {"session_based_favor": True, "session_based_blacklist": True, "session_based_counter": True},
+    "mixed": {"session_based_favor": True, "session_based_blacklist": False, "session_based_counter": False},
+}
+DEFAULT_MARKERS = "上升:0.4,大幅上升:0.05,下降:0.15,大幅下降:0.05,持平:0.25,无:0.1"
+REPLIES = ["好的呀，我记住了", "今天天气不错，我们出去走走吧", "这个问题很有意思，让我想想", "哈哈，你真有趣", "嗯嗯，我明白"]
+# 结果中参与对比的指标，True 表示数值越大越好
+COMPARED_METRICS = {
+    "throughput_msgs_per_s": True,
+    "request_hook_p50_us": False,
+    "request_hook_p99_us": False,
+    "response_hook_p50_us": False,
+    "response_hook_p99_us": False,
+    "load_seconds": False,
+    "close_seconds": False,
+    "bytes_written": False,
+    "backend_records_written": False,
+    "data_dir_bytes": False,
+    "peak_rss_mb": False,
+}
+
+
+def parse_markers(spec: str) -> dict:
+    """"上升:0.4,无:0.1" -> {"[好感度上升]": 0.4, "": 0.1}"""
+    weights = {}
+    for part in spec.split(","):
+        name, weight = part.split(":")
+        name = name.strip()
+        weights["" if name == "无" else f"[好感度{name}]"] = float(weight)
+    return weights
+
+
+def parse_overrides(items: list) -> dict:
+    """--set key=value，value 按 JSON 解析，解析失败时作为字符串"""
+    overrides = {}
+    for item in items:
+        key, value = item.split("=", 1)
+        try:
+            overrides[key] = json.loads(value)
+        except json.JSONDecodeError:
+            overrides[key] = value
+    return overrides
+
+
+def make_workload(params: dict) -> list:
+    """生成消息序列：[(用户ID, 会话ID, 回复文本, 是否为拉黑指令)]"""
+    rng = random.Random(params["seed"])
+    users = [str(100000 + i) for i in range(params["users"])]
+    sessions = [f"aiocqhttp:GroupMessage:{700000 + s}" for s in range(params["sessions"])]
+    home = {user_id: sessions[i % len(sessions)] for i, user_id in enumerate(users)}
+    # Zipf(1) 分布的发言用户
+    cum_weights, total = [], 0.0
+    for rank in range(len(users)):
+        total += 1.0 / (rank + 1)
+        cum_weights.append(total)
+    senders = rng.choices(users, cum_weights=cum_weights, k=params["messages"])
+    markers = parse_markers(params["markers"])
+    chosen = rng.choices(list(markers), weights=list(markers.values()), k=params["messages"])
+
+    workload = []
+    for user_id, marker in zip(senders, chosen):
+        session_id = home[user_id] if rng.random() < 0.9 else rng.choice(sessions)
+        if rng.random() < params["blacklist_churn"]:
+            workload.append((rng.choice(users), session_id, "", True))
+        else:
+            workload.append((user_id, session_id, rng.choice(REPLIES) + marker, False))
+    return workload
+
+
+def percentile(samples: list, q: float) -> float:
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+def io_write_bytes() -> int:
+    """本进程累计写出的字节数（Linux /proc/self/io 的 wchar），不可用时返回 -1"""
+    try:
+        with open("/proc/self/io") as f:
+            for line in f:
+                if line.startswith("wchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return -1
+
+
+def peak_rss_mb() -> float:
+    if resource is None:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节
+    return peak / (2**20 if sys.platform == "darwin" else 2**10)
+
+
+def dir_size(path: Path) -> int:
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+
+
+async def _preload(main, config: dict, workload: list, seed: int):
+    """写入已有数据：每个用户在各自会话中已有好感度，模拟运行一段时间后的插件"""
+    manager = main.FavorManager(config)
+    rng = random.Random(seed)
+    async with manager.abatch():
+        seen = set()
+        for user_id, session_id, _, _ in workload:
+            if (user_id, session_id) not in seen:
+                seen.add((user_id, session_id))
+                manager.set_favor(user_id, rng.randint(-20, 80), session_id)
+    await manager.aclose()
+
+
+async def _simulate(main, config: dict, workload: list, concurrency: int, seed: int) -> dict:
+    await _preload(main, config, workload, seed)
+
+    writes_before = io_write_bytes()
+    start = time.perf_counter()
+    plugin = main.FavorPlugin(None, config)
+    load_seconds = time.perf_counter() - start
+    manager = plugin.manager
+
+    request_latency, response_latency = [], []
+    churn_ops = blocked = 0
+    messages = iter(workload)
+
+    async def worker():
+        nonlocal churn_ops, blocked
+        for user_id, session_id, reply, is_churn in messages:
+            if is_churn:
+                cmd = "移出黑名单" if manager.is_blacklisted(user_id, session_id) else "黑名单"
+                async for _ in plugin.admin_control(StubEvent(ADMIN_ID, session_id), cmd, user_id):
+                    pass
+                churn_ops += 1
+                continue
+            event = StubEvent(user_id, session_id)
+            t0 = time.perf_counter()
+            await plugin.add_relationship_prompt(event, StubRequest())
+            t1 = time.perf_counter()
+            request_latency.append(t1 - t0)
+            if event.stopped:
+                blocked += 1
+                continue
+            await plugin.on_llm_resp(event, StubResponse(reply))
+            response_latency.append(time.perf_counter() - t1)
+            # 让出事件循环，后台写入任务与真实环境一样穿插执行
+            await asyncio.sleep(0)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    await plugin.terminate()
+    close_seconds = time.perf_counter() - start
+    writes_after = io_write_bytes()
+
+    return {
+        "messages": len(workload),
+        "churn_ops": churn_ops,
+        "blocked_requests": blocked,
+        "elapsed_seconds": elapsed,
+        "throughput_msgs_per_s": len(workload) / elapsed,
+        "request_hook_p50_us": percentile(request_latency, 0.50) * 1e6,
+        "request_hook_p99_us": percentile(request_latency, 0.99) * 1e6,
+        "response_hook_p50_us": percentile(response_latency, 0.50) * 1e6,
+        "response_hook_p99_us": percentile(response_latency, 0.99) * 1e6,
+        "load_seconds": load_seconds,
+        "close_seconds": close_seconds,
+        # 系统调用层面的写入量，不可用时退回存储后端自己的统计（SQLite 不统计字节数）
+        "bytes_written": writes_after - writes_before if writes_before >= 0 else manager.backend.bytes_written,
+        "backend_records_written": manager.backend.records_written,
+        "data_dir_bytes": dir_size(manager.DATA_PATH),
+    }
+
+
+def run_scenario(scenario: str, params: dict) -> dict:
+    """在子进程中运行一个场景"""
+    main = load_plugin()
+    config = {
+        "storage_backend": params["backend"],
+        "admins_id": [ADMIN_ID],
+        "favor_random_seed": params["seed"],  # 标记变化值同样按种子抽取，多次运行结果一致
+        **SCENARIOS[scenario],
+        **params["overrides"],
+    }
+    workload = make_workload(params)
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        result = asyncio.run(_simulate(main, config, workload, params["concurrency"], params["seed"]))
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=Path(__file__).parent,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def print_results(results: dict):
+    print(f"{'场景':<8} {'吞吐(条/s)':>11} {'请求p50/p99(us)':>17} {'响应p50/p99(us)':>17} "
+          f"{'加载(s)':>8} {'写入(KB)':>10} {'数据(KB)':>9} {'峰值RSS(MB)':>11}")
+    for name, r in results["scenarios"].items():
+        print(f"{name:<8} {r['throughput_msgs_per_s']:>11.0f} "
+              f"{r['request_hook_p50_us']:>8.1f}/{r['request_hook_p99_us']:<8.1f} "
+              f"{r['response_hook_p50_us']:>8.1f}/{r['response_hook_p99_us']:<8.1f} "
+              f"{r['load_seconds']:>8.3f} {r['bytes_written'] / 1024:>10.0f} {r['data_dir_bytes'] / 1024:>9.0f} "
+              f"{r['peak_rss_mb']:>11.1f}")
+
+
+def compare(old: dict, new: dict):
+    """逐项输出与上一次结果的差异"""
+    if old.get("params") != new.get("params"):
+        print("注意：两次运行的参数不同，结果可能不可比")
+    print(f"\n与 {old.get('git_commit') or '上一次'}（{old.get('created', '')}）对比：")
+    for name, r in new["scenarios"].items():
+        before = old.get("scenarios", {}).get(name)
+        if before is None:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            a, b = before.get(metric), r.get(metric)
+            if not a or b is None:
+                continue
+            change = (b - a) / a
+            worse = change < 0 if higher_is_better else change > 0
+            flag = "  ⚠" if worse and abs(change) >= 0.1 else ""
+            print(f"  {name:<8} {metric:<26} {a:>12.4g} -> {b:>12.4g}  {change:+7.1%}{flag}")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", default="json", choices=["json", "sqlite", "journal"])
+    parser.add_argument("--scenarios", default="global,session")
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--markers", default=DEFAULT_MARKERS)
+    parser.add_argument("--blacklist-churn", type=float, default=0.002)
+    parser.add_argument("--set", dest="overrides", action="append", default=[], metavar="KEY=VALUE")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", metavar="OLD_RESULTS")
+    args = parser.parse_args()
+
+    scenarios = [s.strip() for s in args.scenarios.split(",")]
+    unknown = [s for s in scenarios if s not in SCENARIOS]
+    if unknown:
+        parser.error(f"未知场景：{', '.join(unknown)}（可选 {', '.join(SCENARIOS)}）")
+    params = {
+        "backend": args.backend,
+        "users": args.users,
+        "sessions": args.sessions,
+        "messages": args.messages,
+        "concurrency": args.concurrency,
+        "markers": args.markers,
+        "blacklist_churn": args.blacklist_churn,
+        "overrides": parse_overrides(args.overrides),
+        "seed": args.seed,
+    }
+    results = {
+        "version": RESULTS_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": params,
+        "scenarios": {},
+    }
+    # 每个场景使用新的子进程，峰值 RSS 互不影响
+    ctx = multiprocessing.get_context("spawn")
+    for scenario in scenarios:
+        with ctx.Pool(1) as pool:
+            results["scenarios"][scenario] = pool.apply(run_scenario, (scenario, params))
+
+    print_results(results)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"\n结果已写入 {args.output}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(json.load(f), results)
+
+
+if __name__ == "__main__":
+    main_cli()
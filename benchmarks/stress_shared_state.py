@@ -0,0 +1,147 @@
+"""多实例共享数据压测
+
+多个进程各自运行一个 FavorManager（各自的数据目录），通过 shared_storage_path 共用一个 SQLite 数据库，
+每轮随机修改好感度、计数器、黑名单（偶尔清空整个会话），写入后检查其他实例的修改。结束后校验：
+1. 每个实例内存中的数据与数据库完全一致，黑名单检查结果与名单一致
+2. 每个实例专属用户的计数器精确等于该实例的调用次数，其他实例都能看到
+3. 运行期间只按条目合并其他实例的修改，没有整类重新加载
+
+用法：
+    python benchmarks/stress_shared_state.py [--processes 4] [--rounds 50] [--users 100] [--sessions 4]
+        [--global-scope] [--compact] [--cache-size 0]
+"""
+import os
+import sys
+import json
+import random
+import asyncio
+import argparse
+import tempfile
+import multiprocessing
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _astrbot_stub import load_plugin  # noqa: E402
+
+MARKERS = ["[好感度上升]", "[好感度大幅上升]", "[好感度下降]", "[好感度大幅下降]"]
+DROP = "[好感度大幅下降]"
+
+
+def _config(db_path: str, args) -> dict:
+    return {
+        "shared_storage_path": db_path,
+        "session_based_favor": not args.global_scope,
+        "session_based_blacklist": not args.global_scope,
+        "session_based_counter": not args.global_scope,
+        "min_favor_value": -30,
+        "black_favor_limit": -30,
+        "black_threshold": 10 ** 9,
+        "auto_decrease_counter": False,
+        "auto_blacklist_clean": False,
+        "flush_interval": 3600,
+        "flush_threshold": 10 ** 9,
+        "compact_memory": args.compact,
+        "blacklist_bloom_filter": args.compact,
+        "session_cache_size": args.cache_size,
+        "metrics_enabled": True,
+    }
+
+
+def _normalize(state: dict) -> dict:
+    return json.loads(json.dumps({store: dict(data) for store, data in state.items()}, sort_keys=True))
+
+
+async def _run_worker(main, db_path: str, worker_id: int, args, barrier, results):
+    manager = main.FavorManager(_config(db_path, args))
+    rng = random.Random(worker_id)
+    sessions = [f"g{s}" for s in range(args.sessions)]
+    owned = [f"w{worker_id}_u{i}" for i in range(5)]
+    owned_calls = {}
+    for _ in range(args.rounds):
+        for _ in range(20):
+            session_id = rng.choice(sessions)
+            user_id = f"u{rng.randrange(args.users)}"
+            op = rng.random()
+            if op < 0.6:
+                manager.update_favor(user_id, rng.choice(MARKERS), session_id)
+            elif op < 0.75:
+                manager.set_favor(user_id, rng.randint(-30, 149), session_id)
+            elif op < 0.9:
+                if manager.is_blacklisted(user_id, session_id):
+                    manager.remove_from_blacklist(user_id, session_id)
+                else:
+                    manager.add_to_blacklist(user_id, session_id)
+            elif op < 0.995:
+                # 专属用户在第一个会话中好感度保持下限，每次下降计数器精确加一
+                owner = rng.choice(owned)
+                manager.set_favor(owner, -30, sessions[0])
+                manager.update_favor(owner, DROP, sessions[0])
+                owned_calls[owner] = owned_calls.get(owner, 0) + 1
+            elif session_id != sessions[0]:
+                manager.reset_session(session_id)
+        await manager.aflush()
+        await manager.arefresh()
+
+    barrier.wait()
+    await manager.arefresh()
+    state = _normalize(manager._copy_state())
+    listed = state["session_blacklist"] if not args.global_scope else {None: state["blacklist"]}
+    gate_errors = sum(manager.is_blacklisted(f"u{i}", sid) != (f"u{i}" in listed.get(sid if not args.global_scope else None, {}))
+                      for sid in sessions for i in range(args.users))
+    counters = {uid: manager.get_low_counter(uid, sessions[0])
+                for w in range(args.processes) for uid in (f"w{w}_u{i}" for i in range(5))}
+    reloads = sum(v for (name, _), v in manager.metrics.counters.items() if name == "stores_reloaded_total")
+    patched = sum(v for (name, _), v in manager.metrics.counters.items() if name == "entries_patched_total")
+    results.put((worker_id, state, counters, owned_calls, reloads, patched, gate_errors))
+    await manager.aclose()
+
+
+def _worker(tmp: str, worker_id: int, args, barrier, results):
+    instance_dir = Path(tmp) / f"instance{worker_id}"
+    instance_dir.mkdir()
+    os.chdir(instance_dir)
+    main = load_plugin()
+    asyncio.run(_run_worker(main, str(Path(tmp) / "shared.db"), worker_id, args, barrier, results))
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--sessions", type=int, default=4)
+    parser.add_argument("--global-scope", action="store_true", help="使用全局好感度、黑名单和计数器")
+    parser.add_argument("--compact", action="store_true")
+    parser.add_argument("--cache-size", type=int, default=0)
+    args = parser.parse_args()
+
+    main = load_plugin()
+    storage = sys.modules[main.__package__ + ".storage"]
+    ctx = multiprocessing.get_context("spawn")
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        barrier = ctx.Barrier(args.processes)
+        results = ctx.Queue()
+        workers = [ctx.Process(target=_worker, args=(tmp, w, args, barrier, results)) for w in range(args.processes)]
+        for p in workers:
+            p.start()
+        reports = [results.get() for _ in workers]
+        for p in workers:
+            p.join()
+
+        backend = storage.SqliteBackend(Path(tmp) / "shared.db")
+        expected = _normalize(backend.load_many(storage.STORES))
+        backend.close()
+
+    for worker_id, state, counters, owned_calls, reloads, patched, gate_errors in sorted(reports):
+        mismatched = [store for store in expected if state.get(store) != expected[store]]
+        wrong_counts = [key for w in reports for key, count in w[3].items() if counters.get(key) != count]
+        ok = not mismatched and not wrong_counts and not gate_errors and reloads == 0
+        failed |= not ok
+        print(f"实例{worker_id}：合并条目 {patched:.0f}，整类重新加载 {reloads:.0f}，"
+              f"与数据库不一致 {mismatched or '无'}，计数错误 {len(wrong_counts)}，黑名单检查错误 {gate_errors}：{'通过' if ok else '失败'}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,150 @@
+"""update_favor 并发压测
+
+1. 进程内：同时发起数千个 aupdate_favor 协程，期间后台反复写入并强制重新加载，
+   校验每个用户的低好感计数器精确等于调用次数（加载期间的修改没有被加载结果覆盖）
+2. 多进程：多个 FavorManager 共用同一数据目录，都修改同一批用户（全局和会话）并频繁写入、
+   检查其他进程的修改，校验计数器精确等于全部进程的调用次数之和（没有修改被其他进程覆盖）
+
+用法：
+    python benchmarks/stress_update_favor.py [--backend json|sqlite|journal] [--calls 5000] [--processes 4]
+"""
+import os
+import sys
+import asyncio
+import argparse
+import tempfile
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _astrbot_stub import load_plugin  # noqa: E402
+
+MARKER = "[好感度大幅下降]"
+
+
+def _config(backend: str, **extra) -> dict:
+    # 好感度下限与拉黑阈值相同，每次下降都会使计数器精确加一
+    config = {
+        "storage_backend": backend,
+        "min_favor_value": -30,
+        "black_favor_limit": -30,
+        "auto_decrease_counter": False,
+        "auto_blacklist_clean": False,
+        "flush_interval": 0,
+        "flush_threshold": 7,
+    }
+    config.update(extra)
+    return config
+
+
+async def _in_process(main, backend: str, calls: int, users: int, sessions: int):
+    config = _config(backend, session_based_favor=True, session_based_counter=True)
+    manager = main.FavorManager(config)
+    for i in range(users):
+        for s in range(sessions):
+            manager.session_favor_data.setdefault(f"s{s}", {})[f"u{i}"] = -30
+
+    done = False
+
+    async def update(n: int):
+        await asyncio.sleep(0)
+        await manager.aupdate_favor(f"u{n % users}", MARKER, f"s{n % sessions}")
+
+    async def sync_loop():
+        while not done:
+            await manager.aflush()
+            await manager.arefresh(force=True)
+
+    syncer = asyncio.ensure_future(sync_loop())
+    await asyncio.gather(*(update(n) for n in range(calls)))
+    done = True
+    await syncer
+    await manager.aclose()
+
+    reloaded = main.FavorManager(config)
+    expected = {}
+    for n in range(calls):
+        key = (f"s{n % sessions}", f"u{n % users}")
+        expected[key] = expected.get(key, 0) + 1
+    wrong = [key for key, count in expected.items() if reloaded.get_low_counter(key[1], key[0]) != count]
+    reloaded.close()
+    return wrong
+
+
+def _shared_key(n: int, users: int, sessions: int) -> tuple:
+    """第n次调用修改的 (用户ID, 会话ID)，每 sessions+1 次中有一次修改全局数据"""
+    session = n % (sessions + 1)
+    return f"u{n % users}", (f"s{session}" if session < sessions else None)
+
+
+async def _worker_updates(main, backend: str, calls: int, users: int, sessions: int):
+    manager = main.FavorManager(_config(backend, session_based_favor=True, session_based_counter=True))
+    for n in range(calls):
+        # 每次修改前检查其他进程的修改，尽量制造同一用户的交错读写
+        user_id, session_id = _shared_key(n, users, sessions)
+        await manager.arefresh()
+        manager.update_favor(user_id, MARKER, session_id)
+    await manager.aclose()
+
+
+def _worker(data_dir: str, backend: str, calls: int, users: int, sessions: int):
+    os.chdir(data_dir)
+    asyncio.run(_worker_updates(load_plugin(), backend, calls, users, sessions))
+
+
+def _multi_process(main, backend: str, processes: int, calls: int, users: int, sessions: int):
+    config = _config(backend, session_based_favor=True, session_based_counter=True)
+    # 所有用户的好感度先保存为下限，之后每次下降都会使计数器加一
+    manager = main.FavorManager(config)
+    for n in range(users * (sessions + 1)):
+        user_id, session_id = _shared_key(n, users, sessions)
+        manager.set_favor(user_id, -30, session_id)
+    manager.close()
+
+    ctx = multiprocessing.get_context("spawn")
+    workers = [
+        ctx.Process(target=_worker, args=(os.getcwd(), backend, calls, users, sessions))
+        for _ in range(processes)
+    ]
+    for p in workers:
+        p.start()
+    for p in workers:
+        p.join()
+
+    expected = {}
+    for n in range(calls):
+        key = _shared_key(n, users, sessions)
+        expected[key] = expected.get(key, 0) + processes
+    manager = main.FavorManager(config)
+    wrong = [key for key, count in expected.items() if manager.get_low_counter(*key) != count]
+    manager.close()
+    return wrong
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", default="json", choices=["json", "sqlite", "journal"])
+    parser.add_argument("--calls", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--sessions", type=int, default=4)
+    parser.add_argument("--processes", type=int, default=4)
+    args = parser.parse_args()
+
+    main = load_plugin()
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        wrong = asyncio.run(_in_process(main, args.backend, args.calls, args.users, args.sessions))
+        print(f"进程内 {args.calls} 次并发更新：{'通过' if not wrong else f'{len(wrong)} 个计数错误'}")
+        failed |= bool(wrong)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        calls = args.calls // args.processes
+        wrong = _multi_process(main, args.backend, args.processes, calls, args.users, args.sessions)
+        print(f"{args.processes} 个进程各 {calls} 次更新：{'通过' if not wrong else f'{len(wrong)} 个计数错误'}")
+        failed |= bool(wrong)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,189 @@
+"""会话数据热点缓存
+
+开启会话独立好感度后，session_favor_data 会为机器人待过的每个群保留每个用户的数据。
+SessionCache 只在内存中保留最近访问的会话，其余会话在需要时从存储后端按会话读取：
+- 超过空闲时间（TTL）或常驻条目数超过上限时，按最近最少使用顺序淘汰会话
+- 有未写入修改的会话不会被淘汰，写入后才可以淘汰
+- 记录命中、未命中、淘汰次数，用于调整缓存大小
+- 通过映射接口访问未常驻的会话时同步读取；事件循环中可以先用 missing/install 在存储线程中读取，避免阻塞
+
+以会话为单位缓存而不是以(会话, 用户)为单位：数据按会话分组存放和写入，群通常整体变得不活跃。
+"""
+import time
+from collections import OrderedDict
+from collections.abc import Mapping, MutableMapping
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Set
+
+
+class SessionCache(MutableMapping):
+    """{会话ID: {用户ID: 值}} 的缓存视图，不在内存中的会话由 loader 按需读取"""
+
+    def __init__(
+        self,
+        loader: Callable[[str], Mapping],
+        session_ids: Iterable[str],
+        max_entries: int,
+        ttl: float,
+        is_dirty: Callable[[str], bool],
+        wrap: Callable[[Mapping], Mapping] = dict,
+        clock: Callable[[], float] = time.monotonic,
+        on_drop: Optional[Callable[[str], None]] = None,
+    ):
+        self._loader = loader  # 会话ID -> 该会话在存储后端中的数据
+        self._is_dirty = is_dirty  # 会话是否有未写入的修改
+        self._wrap = wrap  # 把读取结果转换为内存中的表示
+        self._clock = clock
+        self._on_drop = on_drop  # 会话被淘汰或丢弃时调用，用于释放按会话构建的附属数据
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._known = set(session_ids)  # 存储后端和内存中全部会话ID
+        self._resident: "OrderedDict[str, Mapping]" = OrderedDict()  # 常驻会话，按最近访问排序
+        self._access: Dict[str, float] = {}
+        self.generation = 0  # 存储被外部修改的次数，读取期间变化说明读取结果可能已过期
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _page_in(self, session_id: str) -> Optional[Mapping]:
+        """取得会话数据，不在内存中时从存储后端读取"""
+        users = self._resident.get(session_id)
+        now = self._clock()
+        if users is not None:
+            self.hits += 1
+            self._resident.move_to_end(session_id)
+            self._access[session_id] = now
+            return users
+        if session_id not in self._known:
+            return None
+        self.misses += 1
+        return self._admit(session_id, self._loader(session_id), now)
+
+    def _admit(self, session_id: str, data: Mapping, now: float) -> Mapping:
+        users = self._resident[session_id] = self._wrap(data)
+        self._access[session_id] = now
+        self._evict_over_capacity(keep=session_id)
+        return users
+
+    def missing(self, session_id: str) -> bool:
+        """会话在存储中存在但不在内存中（访问时需要读取）"""
+        return session_id in self._known and session_id not in self._resident
+
+    def install(self, session_id: str, data: Mapping, generation: int) -> bool:
+        """放入在别处读取的会话数据；读取期间会话已被读入或存储被外部修改时丢弃，返回是否放入"""
+        if generation != self.generation or not self.missing(session_id):
+            return False
+        self.misses += 1
+        self._admit(session_id, data, self._clock())
+        return True
+
+    def _drop(self, session_id: str):
+        del self._resident[session_id]
+        del self._access[session_id]
+        if self._on_drop is not None:
+            self._on_drop(session_id)
+
+    def _evict_over_capacity(self, keep: Optional[str] = None):
+        """常驻条目数超过上限时淘汰最久未访问的会话"""
+        entries = self.resident_entries()
+        if entries <= self.max_entries:
+            return
+        for session_id in list(self._resident):
+            if entries <= self.max_entries:
+                break
+            if session_id == keep or self._is_dirty(session_id):
+                continue
+            entries -= len(self._resident[session_id])
+            self._drop(session_id)
+            self.evictions += 1
+
+    def evict_idle(self) -> int:
+        """淘汰超过空闲时间的会话和超出容量的会话，返回淘汰数量"""
+        before = self.evictions
+        deadline = self._clock() - self.ttl
+        for session_id in list(self._resident):
+            if self._access[session_id] > deadline:
+                break
+            if not self._is_dirty(session_id):
+                self._drop(session_id)
+                self.evictions += 1
+        self._evict_over_capacity()
+        return self.evictions - before
+
+    def invalidate(self, session_ids: Iterable[str]):
+        """存储被外部修改：更新会话列表，丢弃没有未写入修改的常驻会话，之后按需重新读取"""
+        self.generation += 1
+        self._known = set(session_ids) | set(self._resident)
+        for session_id in list(self._resident):
+            if not self._is_dirty(session_id):
+                self._drop(session_id)
+
+    def invalidate_sessions(self, session_ids: Iterable[str]) -> Set[str]:
+        """存储中这些会话被其他实例修改：丢弃没有未写入修改的常驻副本，返回仍常驻的会话"""
+        self.generation += 1
+        kept = set()
+        for session_id in session_ids:
+            self._known.add(session_id)
+            if session_id in self._resident:
+                if self._is_dirty(session_id):
+                    kept.add(session_id)
+                else:
+                    self._drop(session_id)
+        return kept
+
+    def resident_entries(self) -> int:
+        return sum(len(users) for users in self._resident.values())
+
+    def resident_items(self) -> Iterator[tuple]:
+        """常驻会话的 (会话ID, 数据)，不触发读取"""
+        return iter(list(self._resident.items()))
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "resident_sessions": len(self._resident),
+            "resident_entries": self.resident_entries(),
+            "known_sessions": len(self._known),
+        }
+
+    def __getitem__(self, session_id: str) -> Mapping:
+        users = self._page_in(session_id)
+        if users is None:
+            raise KeyError(session_id)
+        return users
+
+    def get(self, session_id: str, default: Any = None) -> Any:
+        users = self._page_in(session_id)
+        return default if users is None else users
+
+    def __contains__(self, session_id: Any) -> bool:
+        # 只查会话列表，不触发读取
+        return session_id in self._known
+
+    def __setitem__(self, session_id: str, users: Mapping):
+        self._known.add(session_id)
+        self._resident[session_id] = self._wrap(users)
+        self._resident.move_to_end(session_id)
+        self._access[session_id] = self._clock()
+
+    def setdefault(self, session_id: str, default: Optional[Mapping] = None) -> Mapping:
+        users = self._page_in(session_id)
+        if users is None:
+            self[session_id] = default if default is not None else {}
+            users = self._resident[session_id]
+        return users
+
+    def __delitem__(self, session_id: str):
+        self._known.remove(session_id)
+        if session_id in self._resident:
+            self._drop(session_id)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._known))
+
+    def __len__(self) -> int:
+        return len(self._known)
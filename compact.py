@@ -0,0 +1,271 @@
+"""紧凑内存表示
+
+会话数据在大群中可达数百万条，嵌套 dict 每条要占用数百字节（字符串键、整数对象、条目 dict）。
+紧凑模式下：
+- 用户/会话ID经 IdTable 编码为整数：纯数字ID（QQ号等）直接转换，其余ID驻留为负数编号
+- CompactMap 按编码排序存放在 array('q') 中，值按列存放在类型化数组中（整数为 int32），查找用 bisect
+- CompactSessionMap 为 {会话ID: CompactMap}
+
+两者都实现 MutableMapping 接口，FavorManager 中按 dict 访问数据的代码无需修改。
+插入和删除需要移动数组元素，为 O(n) 的内存拷贝，单个会话百万条时仍在毫秒以内；
+单次读取约比 dict 慢一个数量级（微秒级），见 benchmarks/bench_memory.py。
+"""
+import math
+import threading
+from array import array
+from bisect import bisect_left
+from collections.abc import ItemsView, Mapping, MutableMapping, ValuesView
+from typing import Any, Dict, Iterator, List, Optional
+
+# 能直接存入 int64 的十进制ID最大位数
+_MAX_NUMERIC_DIGITS = 18
+
+
+class IdTable:
+    """用户/会话ID编码表，驻留的非数字ID不会被回收（数量与不同ID数相同）"""
+
+    def __init__(self):
+        self._codes: Dict[str, int] = {}
+        self._names: List[str] = []
+        self._lock = threading.Lock()  # 加载数据在存储线程中进行
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    @staticmethod
+    def _numeric(name: str) -> bool:
+        # 有前导零的ID转换后无法还原，按非数字ID驻留
+        return name.isdigit() and name.isascii() and len(name) <= _MAX_NUMERIC_DIGITS and (name[0] != "0" or name == "0")
+
+    def code(self, name: str) -> int:
+        """ID的整数编码，未驻留的非数字ID会被驻留"""
+        if self._numeric(name):
+            return int(name)
+        code = self._codes.get(name)
+        if code is None:
+            with self._lock:
+                code = self._codes.get(name)
+                if code is None:
+                    self._names.append(name)
+                    code = self._codes[name] = -len(self._names)
+        return code
+
+    def lookup(self, name: Any) -> Optional[int]:
+        """只查询不驻留，未出现过的ID返回None"""
+        if not isinstance(name, str):
+            return None
+        if self._numeric(name):
+            return int(name)
+        return self._codes.get(name)
+
+    def name(self, code: int) -> str:
+        return str(code) if code >= 0 else self._names[-code - 1]
+
+
+class IntCodec:
+    """整数值：好感度、计数器，以 int32 存放"""
+
+    typecodes = ("i",)
+
+    @staticmethod
+    def get(columns, pos: int) -> int:
+        return columns[0][pos]
+
+    @staticmethod
+    def set(columns, pos: int, value: Any):
+        columns[0][pos] = int(value)
+
+    @staticmethod
+    def insert(columns, pos: int, value: Any):
+        columns[0].insert(pos, int(value))
+
+
+class BlacklistCodec:
+    """黑名单条目 {"timestamp": 时间, "auto_added": 是否自动拉黑}，没有时间的条目以 NaN 表示"""
+
+    typecodes = ("d", "b")
+
+    @staticmethod
+    def _pack(value: Any) -> tuple:
+        if isinstance(value, Mapping):
+            return float(value.get("timestamp", math.nan)), int(bool(value.get("auto_added", False)))
+        return math.nan, 0
+
+    @staticmethod
+    def get(columns, pos: int) -> Dict[str, Any]:
+        timestamp = columns[0][pos]
+        entry = {} if math.isnan(timestamp) else {"timestamp": timestamp}
+        entry["auto_added"] = bool(columns[1][pos])
+        return entry
+
+    def set(self, columns, pos: int, value: Any):
+        columns[0][pos], columns[1][pos] = self._pack(value)
+
+    def insert(self, columns, pos: int, value: Any):
+        timestamp, auto_added = self._pack(value)
+        columns[0].insert(pos, timestamp)
+        columns[1].insert(pos, auto_added)
+
+
+INT = IntCodec()
+BLACKLIST = BlacklistCodec()
+
+# 可使用紧凑表示的数据类型
+COMPACT_CODECS = {
+    "favor_data": INT,
+    "session_favor_data": INT,
+    "low_counter": INT,
+    "session_low_counter": INT,
+    "blacklist": BLACKLIST,
+    "session_blacklist": BLACKLIST,
+}
+
+
+class _Items(ItemsView):
+    def __iter__(self):
+        m = self._mapping
+        name, get, columns = m._ids.name, m._codec.get, m._columns
+        for pos, code in enumerate(m._keys):
+            yield name(code), get(columns, pos)
+
+
+class _Values(ValuesView):
+    def __iter__(self):
+        m = self._mapping
+        for pos in range(len(m._keys)):
+            yield m._codec.get(m._columns, pos)
+
+
+class CompactMap(MutableMapping):
+    """用户ID → 值的紧凑映射"""
+
+    __slots__ = ("_ids", "_codec", "_keys", "_columns")
+
+    def __init__(self, ids: IdTable, codec, data: Optional[Mapping] = None):
+        self._ids = ids
+        self._codec = codec
+        self._keys = array("q")
+        self._columns = [array(t) for t in codec.typecodes]
+        if data:
+            self._bulk_load(data)
+
+    def _bulk_load(self, data: Mapping):
+        """一次性按编码排序构建，避免逐条插入移动数组"""
+        code = self._ids.code
+        for key_code, value in sorted((code(k), v) for k, v in data.items()):
+            self._keys.append(key_code)
+            self._codec.insert(self._columns, len(self._keys) - 1, value)
+
+    def _find(self, key: Any) -> int:
+        """返回键所在位置，不存在时返回-1"""
+        code = self._ids.lookup(key)
+        if code is None:
+            return -1
+        keys = self._keys
+        pos = bisect_left(keys, code)
+        return pos if pos < len(keys) and keys[pos] == code else -1
+
+    def __getitem__(self, key: Any) -> Any:
+        pos = self._find(key)
+        if pos < 0:
+            raise KeyError(key)
+        return self._codec.get(self._columns, pos)
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        pos = self._find(key)
+        return default if pos < 0 else self._codec.get(self._columns, pos)
+
+    def __contains__(self, key: Any) -> bool:
+        return self._find(key) >= 0
+
+    def __setitem__(self, key: str, value: Any):
+        code = self._ids.code(key)
+        pos = bisect_left(self._keys, code)
+        if pos < len(self._keys) and self._keys[pos] == code:
+            self._codec.set(self._columns, pos, value)
+        else:
+            self._keys.insert(pos, code)
+            self._codec.insert(self._columns, pos, value)
+
+    def __delitem__(self, key: Any):
+        pos = self._find(key)
+        if pos < 0:
+            raise KeyError(key)
+        del self._keys[pos]
+        for column in self._columns:
+            del column[pos]
+
+    def __iter__(self) -> Iterator[str]:
+        name = self._ids.name
+        return (name(code) for code in self._keys)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def items(self):
+        return _Items(self)
+
+    def values(self):
+        return _Values(self)
+
+    def clear(self):
+        self._keys = array("q")
+        self._columns = [array(t) for t in self._codec.typecodes]
+
+    def __repr__(self) -> str:
+        return f"CompactMap({dict(self.items())!r})"
+
+
+def blacklist_timestamps(entries: Mapping) -> Iterator[tuple]:
+    """黑名单条目的 (用户ID, 加入时间)，没有时间的条目为0；紧凑映射直接读取时间列，不构造条目字典"""
+    if isinstance(entries, CompactMap) and entries._codec is BLACKLIST:
+        name = entries._ids.name
+        return ((name(code), 0 if math.isnan(t) else t) for code, t in zip(entries._keys, entries._columns[0]))
+    return ((user_id, data.get("timestamp", 0) if isinstance(data, Mapping) else 0) for user_id, data in entries.items())
+
+
+class CompactSessionMap(MutableMapping):
+    """会话ID → CompactMap，赋值为普通 dict 时自动转换"""
+
+    __slots__ = ("_ids", "_codec", "_sessions")
+
+    def __init__(self, ids: IdTable, codec, data: Optional[Mapping] = None):
+        self._ids = ids
+        self._codec = codec
+        self._sessions: Dict[str, CompactMap] = {}
+        for session_id, users in (data or {}).items():
+            self[session_id] = users
+
+    def __getitem__(self, session_id: str) -> CompactMap:
+        return self._sessions[session_id]
+
+    def get(self, session_id: str, default: Any = None) -> Any:
+        return self._sessions.get(session_id, default)
+
+    def __contains__(self, session_id: Any) -> bool:
+        return session_id in self._sessions
+
+    def __setitem__(self, session_id: str, users: Mapping):
+        if not (isinstance(users, CompactMap) and users._ids is self._ids and users._codec is self._codec):
+            users = CompactMap(self._ids, self._codec, users)
+        self._sessions[session_id] = users
+
+    def setdefault(self, session_id: str, default: Optional[Mapping] = None) -> CompactMap:
+        if session_id not in self._sessions:
+            self[session_id] = default or {}
+        return self._sessions[session_id]
+
+    def __delitem__(self, session_id: str):
+        del self._sessions[session_id]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._sessions)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def clear(self):
+        self._sessions.clear()
+
+    def __repr__(self) -> str:
+        return f"CompactSessionMap({self._sessions!r})"
@@ -0,0 +1,91 @@
+"""好感度变化规则
+
+- 标记对应的变化值按标记表中的分布抽取（见 markers.parse_marker_table），随机数生成器可固定种子，
+  相同的消息序列得到相同的结果，便于复现问题和回放基准
+- 按会话配置变化倍数，例如在测试群中减半
+- 好感度在用户闲置时逐步回落到0：每闲置一个间隔向0移动固定数值。读取时按上次计时起点计算有效值，
+  不需要定时遍历全部用户；存储线程定期用批量计算把已回落的值写回，批量计算优先使用 NumPy
+"""
+import random
+from typing import Dict, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # 未安装 NumPy 时逐个计算
+    np = None
+
+from .markers import MarkerEngine
+
+
+def parse_multipliers(entries: List[str]) -> Dict[str, float]:
+    """解析会话倍数配置 "会话ID:倍数"，会话ID中可以包含冒号"""
+    multipliers: Dict[str, float] = {}
+    for entry in entries:
+        try:
+            session_id, value = str(entry).rsplit(":", 1)
+            multipliers[session_id] = float(value)
+        except ValueError:
+            continue
+    return multipliers
+
+
+class FavorDynamics:
+    """好感度变化规则：标记变化值、会话倍数、闲置回落"""
+
+    def __init__(
+        self,
+        markers: MarkerEngine,
+        multipliers: List[str] = (),
+        decay_hours: float = 0,
+        decay_amount: int = 1,
+        seed: Optional[int] = None,
+    ):
+        self.markers = markers
+        self.multipliers = parse_multipliers(multipliers)
+        self.decay_interval = decay_hours * 3600  # 0为不回落
+        self.decay_amount = decay_amount
+        self.rng = random.Random(seed)
+
+    @property
+    def decay_enabled(self) -> bool:
+        return self.decay_interval > 0 and self.decay_amount > 0
+
+    def roll(self, marker: Optional[str], session_id: str = None) -> Optional[int]:
+        """按标记和会话倍数生成好感度变化值，未知标记返回None"""
+        delta = self.markers.roll(marker, self.rng)
+        if delta is None or not session_id:
+            return delta
+        multiplier = self.multipliers.get(session_id)
+        return delta if multiplier is None else int(round(delta * multiplier))
+
+    def decayed(self, value: int, anchor: Optional[float], now: float) -> Tuple[int, Optional[float]]:
+        """根据计时起点计算回落后的有效值，返回(有效值, 新的计时起点)"""
+        if not self.decay_enabled or anchor is None or value == 0:
+            return value, anchor
+        steps = int((now - anchor) // self.decay_interval)
+        if steps <= 0:
+            return value, anchor
+        # 计时起点只前移整数个间隔，保留未满一个间隔的进度
+        step = steps * self.decay_amount
+        value = max(0, value - step) if value > 0 else min(0, value + step)
+        return value, anchor + steps * self.decay_interval
+
+    def decay_batch(self, values: Sequence[int], anchors: Sequence[float], now: float) -> List[Tuple[int, int, float]]:
+        """批量计算回落，返回有变化的 [(下标, 有效值, 新的计时起点)]"""
+        if not self.decay_enabled or not values:
+            return []
+        if np is None:
+            changed = []
+            for i, (value, anchor) in enumerate(zip(values, anchors)):
+                new_value, new_anchor = self.decayed(value, anchor, now)
+                if new_value != value:
+                    changed.append((i, new_value, new_anchor))
+            return changed
+        value_arr = np.asarray(values, dtype=np.int64)
+        anchor_arr = np.asarray(anchors, dtype=np.float64)
+        steps = np.maximum((now - anchor_arr) // self.decay_interval, 0).astype(np.int64)
+        step = steps * self.decay_amount
+        new_values = np.where(value_arr > 0, np.maximum(value_arr - step, 0), np.minimum(value_arr + step, 0))
+        new_anchors = anchor_arr + steps * self.decay_interval
+        index = np.flatnonzero(new_values != value_arr)
+        return list(zip(index.tolist(), new_values[index].tolist(), new_anchors[index].tolist()))
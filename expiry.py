@@ -0,0 +1,45 @@
+"""按到期时间排序的过期索引
+
+自动移出黑名单、低好感计数器自动减少等到期任务按到期时间存放在最小堆中，
+每次检查只弹出已到期的条目，耗费 O(到期条目数 · log n)，不再全量扫描。
+条目被弹出后由调用方根据当前数据校验是否仍然有效（惰性删除）。
+"""
+import heapq
+import itertools
+from typing import List, Optional, Tuple
+
+# 条目类型
+BLACKLIST = "blacklist"  # 自动拉黑到期移出
+DECREASE = "decrease"  # 低好感计数器到期减少
+
+ExpiryEntry = Tuple[float, int, str, Optional[str], str]
+
+
+class ExpiryIndex:
+    """到期时间最小堆"""
+
+    def __init__(self):
+        self._heap: List[ExpiryEntry] = []
+        self._seq = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def clear(self):
+        self._heap.clear()
+
+    def schedule(self, due: float, kind: str, user_id: str, session_id: Optional[str] = None):
+        """登记一个到期任务"""
+        heapq.heappush(self._heap, (due, next(self._seq), kind, session_id, user_id))
+
+    def next_due(self) -> Optional[float]:
+        """最早的到期时间，没有任务时返回None"""
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: float) -> List[Tuple[str, Optional[str], str]]:
+        """弹出所有已到期的任务：[(类型, 会话ID, 用户ID)]"""
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            _, _, kind, session_id, user_id = heapq.heappop(self._heap)
+            due.append((kind, session_id, user_id))
+        return due
@@ -0,0 +1,67 @@
+"""黑名单成员过滤器
+
+每次 LLM 请求前都要检查发送者是否在黑名单中，而绝大多数用户并不在名单中。
+普通模式下黑名单是 dict，按键查询本身就是 O(1) 的哈希查找，不需要过滤器；紧凑内存模式下黑名单是
+按编码排序的数组，每次查询需要编码ID再二分查找。名单很大时可以在前面加一个布隆过滤器：
+- 不在过滤器中的用户一定不在名单中，只需一次哈希和两次位测试
+- 可能在名单中时再查询名单本身确认，结果始终准确
+布隆过滤器不支持删除，移出名单的用户只会提高误判率；加入或移出的条目过多时按当前名单重建。
+"""
+from typing import Callable, Hashable, Iterable
+
+# 每个成员占用的位数，两个哈希位置时容量内误判率约1.4%
+BITS_PER_ENTRY = 16
+MIN_CAPACITY = 1024
+
+
+class MembershipFilter:
+    """黑名单成员的布隆过滤器：全局成员以用户ID为键，会话成员以(会话ID, 用户ID)为键
+
+    哈希位置取自 Python 的 hash()，字符串的哈希值会被缓存，重复查询同一个ID时不需要重新计算
+    """
+
+    def __init__(self, members: Callable[[], Iterable[Hashable]]):
+        self._members = members  # 重建时枚举名单中的全部成员
+        self.rebuild()
+
+    def rebuild(self):
+        """按当前名单重建，容量为成员数的两倍"""
+        members = list(self._members())
+        self.capacity = max(len(members) * 2, MIN_CAPACITY)
+        size = 1 << (self.capacity * BITS_PER_ENTRY - 1).bit_length()  # 位数取2的幂，用掩码代替取模
+        self._mask = size - 1
+        self._bits = bytearray(size >> 3)
+        self.count = 0
+        self._removed = 0
+        for key in members:
+            self._set(key)
+
+    def _set(self, key: Hashable):
+        h = hash(key)
+        a, b = h & self._mask, (h >> 32) & self._mask
+        self._bits[a >> 3] |= 1 << (a & 7)
+        self._bits[b >> 3] |= 1 << (b & 7)
+        self.count += 1
+
+    def add(self, key: Hashable):
+        """成员加入名单后调用"""
+        if self.count >= self.capacity:
+            # 超出容量后误判率快速上升，扩容重建（名单中已包含新成员）
+            self.rebuild()
+        else:
+            self._set(key)
+
+    def discard(self, count: int = 1):
+        """成员移出名单后调用，移出过多时重建以降低误判率"""
+        self._removed += count
+        if self._removed > self.capacity // 2:
+            self.rebuild()
+
+    def __contains__(self, key: Hashable) -> bool:
+        """可能在名单中时返回True，返回False时一定不在名单中"""
+        h = hash(key)
+        a = h & self._mask
+        if not self._bits[a >> 3] >> (a & 7) & 1:
+            return False
+        b = (h >> 32) & self._mask
+        return bool(self._bits[b >> 3] >> (b & 7) & 1)
@@ -0,0 +1,199 @@
+"""好感度插件运行统计
+
+记录热点路径的耗时直方图和计数器（标记命中、黑名单事件、写入字节数、重新加载次数等），
+可通过 /管理 统计 查看，或定期导出为 Prometheus 文本 / JSON 文件。
+未启用时使用 NullMetrics，所有记录调用都是空操作。
+"""
+import os
+import json
+import time
+import asyncio
+import functools
+from pathlib import Path
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+from typing import Any, Dict, List, Tuple
+
+# 耗时直方图的桶上限（秒）
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+# 导出时的指标名前缀
+PREFIX = "favor_"
+
+MetricKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+def _key(name: str, labels: Dict[str, Any]) -> MetricKey:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...], extra: str = "") -> str:
+    parts = [f'{k}="{v}"' for k, v in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Histogram:
+    """固定桶的直方图"""
+
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # 最后一个桶为 +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """估算分位数：返回累计数达到 q 的桶的上限"""
+        target = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.bounds, self.counts):
+            cumulative += count
+            if cumulative >= target:
+                return bound
+        return float("inf")
+
+
+class Metrics:
+    """运行统计"""
+
+    enabled = True
+
+    def __init__(self):
+        self.counters: Dict[MetricKey, float] = {}
+        self.histograms: Dict[MetricKey, Histogram] = {}
+        self.started = time.time()
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """计数器加上value"""
+        key = _key(name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        """记录一次耗时（秒）"""
+        key = _key(name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """计时上下文"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def to_prometheus(self) -> str:
+        """Prometheus 文本格式"""
+        lines: List[str] = []
+        for (name, labels), value in sorted(self.counters.items()):
+            lines.append(f"{PREFIX}{name}{_format_labels(labels)} {value:g}")
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            cumulative = 0
+            for bound, count in zip(histogram.bounds + (float("inf"),), histogram.counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound:g}"'
+                lines.append(f"{PREFIX}{name}_bucket{_format_labels(labels, le)} {cumulative}")
+            lines.append(f"{PREFIX}{name}_sum{_format_labels(labels)} {histogram.sum:.9g}")
+            lines.append(f"{PREFIX}{name}_count{_format_labels(labels)} {histogram.count}")
+        lines.append(f"{PREFIX}uptime_seconds {time.time() - self.started:.0f}")
+        return "\n".join(lines) + "\n"
+
+    def to_json(self) -> Dict[str, Any]:
+        """JSON 格式"""
+        return {
+            "uptime_seconds": round(time.time() - self.started),
+            "counters": [{"name": name, "labels": dict(labels), "value": value}
+                         for (name, labels), value in sorted(self.counters.items())],
+            "histograms": [{"name": name, "labels": dict(labels), "count": h.count, "sum": h.sum,
+                            "buckets": dict(zip([f"{b:g}" for b in h.bounds] + ["+Inf"], h.counts))}
+                           for (name, labels), h in sorted(self.histograms.items())],
+        }
+
+    def summary(self) -> str:
+        """/管理 统计 显示的摘要"""
+        lines = [f"运行时间：{(time.time() - self.started) / 3600:.1f}小时", "耗时（次数 / 平均 / P95）："]
+        for (name, labels), h in sorted(self.histograms.items()):
+            if h.count:
+                lines.append(f"  {name}{_format_labels(labels)}：{h.count} / {h.sum / h.count * 1000:.3f}ms"
+                             f" / ≤{h.quantile(0.95) * 1000:g}ms")
+        lines.append("计数：")
+        for (name, labels), value in sorted(self.counters.items()):
+            lines.append(f"  {name}{_format_labels(labels)}：{value:g}")
+        return "\n".join(lines)
+
+    def render(self, fmt: str) -> str:
+        """导出文本：fmt为 prometheus 或 json"""
+        if fmt == "prometheus":
+            return self.to_prometheus()
+        return json.dumps(self.to_json(), ensure_ascii=False, indent=2)
+
+
+class NullMetrics:
+    """未启用统计时使用，所有记录调用都是空操作"""
+
+    enabled = False
+    _NULL_TIMER = nullcontext()
+
+    def inc(self, name: str, value: float = 1, **labels):
+        pass
+
+    def observe(self, name: str, value: float, **labels):
+        pass
+
+    def timer(self, name: str, **labels):
+        return self._NULL_TIMER
+
+    def summary(self) -> str:
+        return "统计未启用（配置 metrics_enabled）"
+
+
+NULL_METRICS = NullMetrics()
+
+
+def write_atomic(path: Path, text: str):
+    """先写临时文件再替换，供导出统计文件使用"""
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_text(text, encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+def timed(name: str, **labels):
+    """方法计时装饰器：统计对象取自 self.metrics，未启用时只多一次属性检查"""
+
+    def decorate(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(self, *args, **kwargs):
+                metrics = self.metrics
+                if not metrics.enabled:
+                    return await func(self, *args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return await func(self, *args, **kwargs)
+                finally:
+                    metrics.observe(name, time.perf_counter() - start, **labels)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            metrics = self.metrics
+            if not metrics.enabled:
+                return func(self, *args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(self, *args, **kwargs)
+            finally:
+                metrics.observe(name, time.perf_counter() - start, **labels)
+        return wrapper
+
+    return decorate
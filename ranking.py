@@ -0,0 +1,138 @@
+"""好感度有序索引
+
+按好感度值分桶：{值: 用户ID集合}，另存按值排序的不同值列表。好感度是有界整数，不同值最多
+几百个，排行、分页、按范围筛选只需从高到低遍历桶，无需对全部用户排序。
+各值的人数另存在覆盖好感度范围的树状数组中，排名和范围计数为 O(log 范围)。
+FavorManager 在首次查询某个会话（或全局）时构建索引，之后随好感度修改增量更新。
+"""
+import heapq
+from bisect import bisect_left, bisect_right, insort
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+
+class Fenwick:
+    """树状数组：单点加减与前缀和均为 O(log n)"""
+
+    def __init__(self, size: int):
+        self._tree = [0] * (size + 1)
+
+    def add(self, pos: int, delta: int):
+        pos += 1
+        while pos < len(self._tree):
+            self._tree[pos] += delta
+            pos += pos & -pos
+
+    def prefix(self, pos: int) -> int:
+        """[0, pos) 的和"""
+        total = 0
+        while pos > 0:
+            total += self._tree[pos]
+            pos -= pos & -pos
+        return total
+
+
+class FavorIndex:
+    """单个会话（或全局）的好感度有序索引"""
+
+    def __init__(self, items: Iterable[Tuple[str, int]] = (), low: int = 0, high: int = 0):
+        self._value_of: Dict[str, int] = {}
+        self._buckets: Dict[int, Set[str]] = {}
+        self._values: List[int] = []  # 存在的不同好感度值，升序
+        # 树状数组覆盖 [self._low, self._high]，出现范围外的值时扩大并重建
+        self._low, self._high = min(low, high), max(low, high)
+        self._counts = Fenwick(self._high - self._low + 1)
+        for user_id, value in items:
+            self.update(user_id, value)
+
+    def __len__(self) -> int:
+        return len(self._value_of)
+
+    def __contains__(self, user_id: str) -> bool:
+        return user_id in self._value_of
+
+    def update(self, user_id: str, value: int):
+        """登记或修改用户的好感度"""
+        old = self._value_of.get(user_id)
+        if old == value:
+            return
+        if old is not None:
+            self._discard(user_id, old)
+        self._value_of[user_id] = value
+        bucket = self._buckets.get(value)
+        if bucket is None:
+            bucket = self._buckets[value] = set()
+            insort(self._values, value)
+        bucket.add(user_id)
+        if not self._low <= value <= self._high:
+            self._grow(value)
+        else:
+            self._counts.add(value - self._low, 1)
+
+    def _grow(self, value: int):
+        """扩大树状数组的范围以包含value，并按桶重建"""
+        self._low, self._high = min(self._low, value), max(self._high, value)
+        self._counts = Fenwick(self._high - self._low + 1)
+        for v, bucket in self._buckets.items():
+            self._counts.add(v - self._low, len(bucket))
+
+    def remove(self, user_id: str):
+        """移除用户"""
+        old = self._value_of.pop(user_id, None)
+        if old is not None:
+            self._discard(user_id, old)
+
+    def _discard(self, user_id: str, value: int):
+        bucket = self._buckets[value]
+        bucket.discard(user_id)
+        self._counts.add(value - self._low, -1)
+        if not bucket:
+            del self._buckets[value]
+            del self._values[bisect_left(self._values, value)]
+
+    def _range(self, low: Optional[int], high: Optional[int]) -> List[int]:
+        """[low, high] 范围内存在的好感度值，升序"""
+        lo = 0 if low is None else bisect_left(self._values, low)
+        hi = len(self._values) if high is None else bisect_right(self._values, high)
+        return self._values[lo:hi]
+
+    def count(self, low: Optional[int] = None, high: Optional[int] = None) -> int:
+        """好感度在 [low, high] 范围内的用户数"""
+        low = self._low if low is None else max(low, self._low)
+        high = self._high if high is None else min(high, self._high)
+        if low > high:
+            return 0
+        return self._counts.prefix(high - self._low + 1) - self._counts.prefix(low - self._low)
+
+    def rank_of(self, value: int) -> int:
+        """好感度为value时的名次（好感度更高的人数 + 1，同分同名次）"""
+        return self.count(value + 1) + 1
+
+    def rank(self, user_id: str) -> Optional[int]:
+        """用户的名次，不在索引中时返回None"""
+        value = self._value_of.get(user_id)
+        return None if value is None else self.rank_of(value)
+
+    def top(self, k: int) -> List[Tuple[str, int]]:
+        """好感度最高的k个用户"""
+        return self.select(limit=k)
+
+    def select(self, low: Optional[int] = None, high: Optional[int] = None,
+               offset: int = 0, limit: Optional[int] = None) -> List[Tuple[str, int]]:
+        """按好感度从高到低返回 [low, high] 范围内的 (用户ID, 好感度)，同分按用户ID排序"""
+        result: List[Tuple[str, int]] = []
+        for value in reversed(self._range(low, high)):
+            bucket = self._buckets[value]
+            if offset >= len(bucket):
+                # 整个桶都在本页之前，直接跳过
+                offset -= len(bucket)
+                continue
+            if limit is None:
+                users = sorted(bucket)
+            else:
+                # 只取本页需要的前 offset+剩余条数 个，不对整个同分桶排序
+                users = heapq.nsmallest(offset + limit - len(result), bucket)
+            result.extend((user_id, value) for user_id in users[offset:])
+            if limit is not None and len(result) >= limit:
+                return result
+            offset = 0
+        return result
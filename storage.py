@@ -0,0 +1,991 @@
+"""好感度系统存储后端
+
+FavorManager 在内存中维护全部数据，存储后端只负责加载与持久化：
+- JsonBackend：每类数据一个 JSON 文件，适合小规模使用；会话数据另存各会话在文件中的位置索引，
+  可按会话读取，写入时只重新序列化被修改的会话
+- SqliteBackend：SQLite（WAL 模式）按行存储，单用户读写为 O(log n)；
+  共享模式下多个实例共用一个数据库，通过修改记录表只重新读取被其他实例修改的条目
+- JournalBackend：JSON 快照 + 追加日志，每次修改只追加一行，同时保留审计记录
+
+命令行工具：
+    python storage.py migrate <JSON数据目录> [SQLite数据库路径]   从JSON文件迁移到SQLite
+    python storage.py history <数据目录> <用户ID>                 查看用户的好感度/黑名单变化记录
+    python storage.py restore <数据目录> <Unix时间戳>             将日志数据恢复到指定时间点
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import sqlite3
+import itertools
+from json.decoder import WHITESPACE
+from collections.abc import Mapping
+from typing import Dict, Any, Optional, Iterable, List, Set
+from pathlib import Path
+
+try:
+    from .locks import FileLock
+except ImportError:  # 作为命令行脚本运行
+    from locks import FileLock
+
+# 全部数据类型
+STORES = (
+    "favor_data",
+    "session_favor_data",
+    "blacklist",
+    "session_blacklist",
+    "whitelist",
+    "low_counter",
+    "session_low_counter",
+    "last_decrease_time",
+    "last_favor_time",
+)
+# 按会话分组的数据类型：{会话ID: {用户ID: 值}}
+SESSION_STORES = {"session_favor_data", "session_blacklist", "session_low_counter"}
+
+# 共享模式修改记录中已删除条目的值
+DELETED = object()
+
+# 脏数据键：普通数据为用户ID，会话数据为(会话ID, 用户ID)，用户ID为None表示整个会话；
+# 键集合为None表示整类数据都需要重写
+DirtyKeys = Optional[Set[Any]]
+# 增量修改：{脏数据键: (变化量, 下限, 上限)}，上下限为None表示不限。好感度、计数器的加减按存储中的
+# 当前值累加而不是覆盖，多个进程同时修改同一用户时不会丢失修改
+Deltas = Optional[Dict[Any, tuple]]
+# write() 的 committed 中表示审计事件已写入的标记（不是数据类型）
+EVENTS = "events"
+
+
+def apply_delta(current: Any, delta: tuple) -> int:
+    """把增量加到存储中的当前值上（不存在时按0计算）并限制在上下限内"""
+    change, low, high = delta
+    value = (current if isinstance(current, int) else 0) + change
+    if low is not None:
+        value = max(low, value)
+    if high is not None:
+        value = min(high, value)
+    return value
+
+
+class StorageBackend:
+    """存储后端基类"""
+
+    # 是否记录好感度变化等审计事件
+    records_events = False
+    # 是否支持按会话读取（会话缓存需要）
+    supports_partial_load = False
+    # 累计写入量（用于运行统计）
+    bytes_written = 0
+    records_written = 0
+
+    def load(self, store: str) -> Dict[str, Any]:
+        """加载一类数据的全部内容"""
+        raise NotImplementedError
+
+    def load_many(self, stores: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """加载多类数据"""
+        return {store: self.load(store) for store in stores}
+
+    def load_session(self, store: str, session_id: str) -> Dict[str, Any]:
+        """读取会话数据中的一个会话"""
+        raise NotImplementedError
+
+    def session_ids(self, store: str) -> Set[str]:
+        """会话数据中的全部会话ID"""
+        raise NotImplementedError
+
+    def iter_sessions(self, store: str) -> Iterable[tuple]:
+        """逐个读取会话数据中的会话：(会话ID, {用户ID: 值})，不影响外部修改检测"""
+        raise NotImplementedError
+
+    def changed_stores(self) -> Set[str]:
+        """返回自上次读写后被外部修改过的数据类型"""
+        return set()
+
+    def changed_entries(self) -> Dict[str, Optional[Dict[Any, Any]]]:
+        """被外部修改过的条目：{数据类型: {脏数据键: 新值，已删除为DELETED}}，值为None表示需要整类重新加载
+
+        会话数据的键为(会话ID, 用户ID)，用户ID为None时值为整个会话的数据
+        """
+        return dict.fromkeys(self.changed_stores())
+
+    def invalidate(self, store: str):
+        """内存中的数据与存储不再一致（例如重新加载的结果因有未保存的修改被丢弃），下次检查时重新加载"""
+
+    def snapshot(self, store: str, data: Dict[str, Any], keys: DirtyKeys, deltas: Deltas = None) -> Any:
+        """在事件循环中提取待写入的数据快照，之后内存数据可继续修改
+
+        deltas中的键按增量写入；整类或整个会话重写时以内存中的值为准，忽略其中的增量
+        """
+        raise NotImplementedError
+
+    def write(self, changes: Dict[str, Any], events: List[Dict[str, Any]] = (), committed: Set[str] = None):
+        """写入快照：{数据类型: snapshot()的返回值}，可在工作线程中执行；events为审计事件
+
+        committed不为空时，每类数据（审计事件为EVENTS）确实写入后立即加入其中，
+        写入中途失败时调用方据此只重试未写入的部分，增量修改不会被重复累加
+        """
+        raise NotImplementedError
+
+    def needs_compaction(self) -> bool:
+        """是否需要压缩存储"""
+        return False
+
+    def compact(self, state: Dict[str, Dict[str, Any]]):
+        """用完整数据压缩存储"""
+
+    def close(self):
+        """关闭后端"""
+
+
+class JsonBackend(StorageBackend):
+    """JSON 文件存储后端
+
+    会话数据文件旁另存位置索引 <数据类型>.index.json：{"signature": 文件签名, "sessions": {会话ID: [起始字节, 结束字节]}}，
+    按会话读取时只需定位读取一段字节（不使用 mmap：Windows 下无法替换已映射的文件）。
+    索引与文件签名不符时（旧版本写入或被外部修改）扫描一遍文件重建。
+    """
+
+    supports_partial_load = True
+
+    def __init__(self, data_path: Path):
+        self.data_path = Path(data_path)
+        self._signatures: Dict[str, Optional[tuple]] = {}  # 文件签名(mtime, size, inode)
+        self._indexes: Dict[str, tuple] = {}  # 会话位置索引：{数据类型: (文件签名, {会话ID: (起始, 结束)})}
+        self._lock = FileLock(self.data_path / ".lock")
+
+    def _path(self, store: str) -> Path:
+        return self.data_path / f"{store}.json"
+
+    def _index_path(self, store: str) -> Path:
+        return self.data_path / f"{store}.index.json"
+
+    def _signature(self, store: str) -> Optional[tuple]:
+        """获取文件签名，文件不存在时返回None"""
+        try:
+            st = os.stat(self._path(store))
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def _open_indexed(self, store: str) -> tuple:
+        """打开会话数据文件并取得与之对应的位置索引，文件不存在时返回(None, {})"""
+        try:
+            f = open(self._path(store), "rb")
+        except FileNotFoundError:
+            return None, {}
+        st = os.fstat(f.fileno())
+        signature = (st.st_mtime_ns, st.st_size, st.st_ino)
+        cached = self._indexes.get(store)
+        if cached is not None and cached[0] == signature:
+            return f, cached[1]
+        index = None
+        try:
+            with open(self._index_path(store), "r", encoding="utf-8") as index_file:
+                saved = json.load(index_file)
+            if tuple(saved["signature"]) == signature:
+                index = {sid: tuple(span) for sid, span in saved["sessions"].items()}
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        if index is None:
+            index = self._scan_sessions(f.read())
+            self._save_index(store, signature, index)
+        self._indexes[store] = (signature, index)
+        return f, index
+
+    @staticmethod
+    def _scan_sessions(raw: bytes) -> Dict[str, tuple]:
+        """扫描 {会话ID: {...}, ...} 格式的文件，返回各会话的值在文件中的字节范围"""
+        try:
+            text = raw.decode("utf-8")
+            decoder = json.JSONDecoder()
+            ascii_only = text.isascii()
+            index: Dict[str, tuple] = {}
+            char_pos = byte_pos = 0
+
+            def to_bytes(pos: int) -> int:
+                # 含非ASCII字符时按顺序累加编码长度换算字节位置
+                nonlocal char_pos, byte_pos
+                if ascii_only:
+                    return pos
+                byte_pos += len(text[char_pos:pos].encode("utf-8"))
+                char_pos = pos
+                return byte_pos
+
+            pos = WHITESPACE.match(text, 0).end()
+            if text[pos] != "{":
+                return {}
+            pos = WHITESPACE.match(text, pos + 1).end()
+            while text[pos] != "}":
+                session_id, pos = decoder.raw_decode(text, pos)
+                pos = WHITESPACE.match(text, pos).end() + 1  # 跳过冒号
+                start = WHITESPACE.match(text, pos).end()
+                _, end = decoder.raw_decode(text, start)
+                index[str(session_id)] = (to_bytes(start), to_bytes(end))
+                pos = WHITESPACE.match(text, end).end()
+                if text[pos] == ",":
+                    pos = WHITESPACE.match(text, pos + 1).end()
+            return index
+        except (ValueError, IndexError):
+            return {}
+
+    def _save_index(self, store: str, signature: tuple, index: Dict[str, tuple]):
+        path = self._index_path(store)
+        tmp_path = path.with_name(path.name + ".tmp")
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"signature": list(signature), "sessions": index}, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp_path, path)
+        except OSError:
+            # 索引只用于加速，写入失败时下次重新扫描
+            pass
+
+    @staticmethod
+    def _read_span(f, span: tuple) -> Dict[str, Any]:
+        f.seek(span[0])
+        return {str(k): v for k, v in json.loads(f.read(span[1] - span[0])).items()}
+
+    def load_session(self, store: str, session_id: str) -> Dict[str, Any]:
+        f, index = self._open_indexed(store)
+        if f is None:
+            return {}
+        with f:
+            return self._read_span(f, index[session_id]) if session_id in index else {}
+
+    def session_ids(self, store: str) -> Set[str]:
+        self._signatures[store] = self._signature(store)
+        f, index = self._open_indexed(store)
+        if f is not None:
+            f.close()
+        return set(index)
+
+    def iter_sessions(self, store: str) -> Iterable[tuple]:
+        f, index = self._open_indexed(store)
+        if f is None:
+            return
+        with f:
+            for session_id, span in index.items():
+                yield session_id, self._read_span(f, span)
+
+    def load(self, store: str) -> Dict[str, Any]:
+        path = self._path(store)
+        self._signatures[store] = self._signature(store)
+        if path.exists():
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    return {str(k): v for k, v in json.load(f).items()}
+            except (json.JSONDecodeError, TypeError, AttributeError):
+                return {}
+        return {}
+
+    def changed_stores(self) -> Set[str]:
+        return {store for store in STORES if self._signature(store) != self._signatures.get(store)}
+
+    def invalidate(self, store: str):
+        self._signatures[store] = None
+
+    def snapshot(self, store: str, data: Dict[str, Any], keys: DirtyKeys, deltas: Deltas = None) -> Any:
+        # 会话数据只复制被修改的会话，写入时其余会话从原文件复制；其他数据整文件重写
+        deltas = dict(deltas or {}) if keys is not None else {}
+        if store in SESSION_STORES and keys is not None:
+            sessions = {sid for sid, _ in keys}
+            return ("sessions", {sid: dict(data.get(sid) or {}) for sid in sessions}, set(keys), deltas)
+        copied = {k: (dict(v) if isinstance(v, Mapping) else v) for k, v in data.items()}
+        return ("all", copied, None if keys is None else set(keys), deltas)
+
+    def write(self, changes: Dict[str, Any], events: List[Dict[str, Any]] = (), committed: Set[str] = None):
+        # 持有跨进程文件锁，文件被其他进程修改过时只把本进程修改的键合并进去；每类数据一个文件，逐类提交
+        committed = set() if committed is None else committed
+        with self._lock.hold():
+            for store, (mode, data, keys, deltas) in changes.items():
+                if mode == "sessions":
+                    external = self._signature(store) != self._signatures.get(store)
+                    self._write_sessions(store, data, keys, deltas)
+                    if external:
+                        # 合并结果与内存不一致，下次刷新时重新加载
+                        self._signatures[store] = None
+                elif keys is not None:
+                    # 只改部分键时总是合并到磁盘数据上：文件签名未变也不能说明内存与文件一致
+                    # （刷新读到的新文件可能因内存有未写入的修改而被丢弃）
+                    external = self._signature(store) != self._signatures.get(store)
+                    self._write_file(self._merge(self.load(store), data, store, keys, deltas), store)
+                    if external:
+                        # 合并结果与内存不一致，下次刷新时重新加载
+                        self._signatures[store] = None
+                else:
+                    self._write_file(data, store)
+                committed.add(store)
+
+    @staticmethod
+    def _merge(disk: Dict[str, Any], data: Dict[str, Any], store: str, keys: Set[Any], deltas: Dict[Any, tuple]) -> Dict[str, Any]:
+        """将内存中脏数据键的值合并到磁盘数据上，增量修改的键累加到磁盘中的值上"""
+        for key in keys:
+            if store in SESSION_STORES:
+                sid, uid = key
+                users = data.get(sid, {})
+                if uid is None:
+                    disk[sid] = dict(users)
+                    continue
+                target = disk.setdefault(sid, {})
+            else:
+                uid, users, target = key, data, disk
+            if key in deltas:
+                target[uid] = apply_delta(target.get(uid), deltas[key])
+            elif uid in users:
+                target[uid] = users[uid]
+            else:
+                target.pop(uid, None)
+        return disk
+
+    def _write_file(self, data: Dict[str, Any], store: str):
+        """先写临时文件再原子替换，避免崩溃时留下残缺文件"""
+        if store in SESSION_STORES:
+            self._write_session_file(store, ((str(sid), users) for sid, users in data.items()))
+            self.records_written += len(data)
+            return
+        path = self._path(store)
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({str(k): v for k, v in data.items()}, f, ensure_ascii=False, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+            self.bytes_written += f.tell()
+        os.replace(tmp_path, path)
+        self.records_written += len(data)
+        self._signatures[store] = self._signature(store)
+
+    def _write_sessions(self, store: str, sessions: Dict[str, Dict[str, Any]], keys: Set[Any], deltas: Dict[Any, tuple]):
+        """按会话重写：未修改的会话直接复制原文件中的字节，被修改的会话按脏数据键合并到磁盘数据后重新序列化"""
+        dirty: Dict[str, Optional[Set[str]]] = {}
+        for sid, uid in keys:
+            if uid is None:
+                dirty[sid] = None
+            elif dirty.get(sid, ()) is not None:
+                dirty.setdefault(sid, set()).add(uid)
+        src, index = self._open_indexed(store)
+        try:
+            def entries():
+                for sid, span in index.items():
+                    if sid not in dirty:
+                        src.seek(span[0])
+                        yield sid, src.read(span[1] - span[0])
+                for sid, uids in dirty.items():
+                    users = sessions.get(sid, {})
+                    if uids is not None:
+                        merged = self._read_span(src, index[sid]) if sid in index else {}
+                        for uid in uids:
+                            if (sid, uid) in deltas:
+                                merged[uid] = apply_delta(merged.get(uid), deltas[(sid, uid)])
+                            elif uid in users:
+                                merged[uid] = users[uid]
+                            else:
+                                merged.pop(uid, None)
+                        users = merged
+                    if users:
+                        yield sid, users
+
+            self._write_session_file(store, entries())
+        finally:
+            if src is not None:
+                src.close()
+        self.records_written += len(keys)
+
+    def _write_session_file(self, store: str, sessions: Iterable[tuple]):
+        """写入会话数据文件并保存位置索引；会话的值为原始字节时直接写入"""
+        path = self._path(store)
+        tmp_path = path.with_name(path.name + ".tmp")
+        index: Dict[str, tuple] = {}
+        with open(tmp_path, "wb") as f:
+            f.write(b"{")
+            for sid, users in sessions:
+                f.write((b"," if index else b"") + json.dumps(sid, ensure_ascii=False).encode("utf-8") + b":")
+                start = f.tell()
+                if not isinstance(users, bytes):
+                    users = json.dumps({str(k): v for k, v in users.items()}, ensure_ascii=False,
+                                       separators=(",", ":")).encode("utf-8")
+                f.write(users)
+                index[sid] = (start, f.tell())
+            f.write(b"}")
+            f.flush()
+            os.fsync(f.fileno())
+            self.bytes_written += f.tell()
+        os.replace(tmp_path, path)
+        signature = self._signatures[store] = self._signature(store)
+        self._indexes[store] = (signature, index)
+        self._save_index(store, signature, index)
+
+
+# SQLite 表结构：数据类型 -> (表名, 值字段)
+# 全局数据的 session_id 固定为空字符串，与会话数据共用一张表
+_TABLES = {
+    "favor_data": ("favor", ("value",)),
+    "session_favor_data": ("favor", ("value",)),
+    "blacklist": ("blacklist", ("timestamp", "auto_added")),
+    "session_blacklist": ("blacklist", ("timestamp", "auto_added")),
+    "whitelist": ("whitelist", ()),
+    "low_counter": ("low_counter", ("value",)),
+    "session_low_counter": ("low_counter", ("value",)),
+    "last_decrease_time": ("last_decrease_time", ("value",)),
+    "last_favor_time": ("last_favor_time", ("value",)),
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS favor (
+    session_id TEXT NOT NULL, user_id TEXT NOT NULL, value INTEGER NOT NULL,
+    PRIMARY KEY (session_id, user_id)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS blacklist (
+    session_id TEXT NOT NULL, user_id TEXT NOT NULL, timestamp REAL NOT NULL, auto_added INTEGER NOT NULL,
+    PRIMARY KEY (session_id, user_id)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS whitelist (
+    session_id TEXT NOT NULL, user_id TEXT NOT NULL,
+    PRIMARY KEY (session_id, user_id)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS low_counter (
+    session_id TEXT NOT NULL, user_id TEXT NOT NULL, value INTEGER NOT NULL,
+    PRIMARY KEY (session_id, user_id)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS last_decrease_time (
+    session_id TEXT NOT NULL, user_id TEXT NOT NULL, value REAL NOT NULL,
+    PRIMARY KEY (session_id, user_id)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS last_favor_time (
+    session_id TEXT NOT NULL, user_id TEXT NOT NULL, value REAL NOT NULL,
+    PRIMARY KEY (session_id, user_id)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS blacklist_expiry ON blacklist (auto_added, timestamp);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value) WITHOUT ROWID;
+"""
+
+# 共享模式的修改记录：每次写入在同一事务中追加被修改的键，
+# session_id 和 user_id 都为空表示整类重写，只有 user_id 为空表示整个会话重写
+_CHANGE_LOG_SCHEMA = """
+CREATE TABLE IF NOT EXISTS change_log (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT, t REAL NOT NULL, origin TEXT NOT NULL,
+    store TEXT NOT NULL, session_id TEXT, user_id TEXT);
+"""
+# 修改记录保留时间（秒），离线更久的实例按序号断档整体重新加载
+CHANGE_LOG_RETENTION = 3600
+# 清理修改记录的最小间隔（秒）
+CHANGE_LOG_PRUNE_INTERVAL = 60
+# 一类数据被修改的条目超过该数量时整类重新加载
+MAX_PATCH_ENTRIES = 10000
+
+
+def _encode(store: str, value: Any) -> tuple:
+    """将内存中的值转换为表字段"""
+    if store in ("blacklist", "session_blacklist"):
+        if isinstance(value, Mapping):
+            return (float(value.get("timestamp", 0)), int(bool(value.get("auto_added", False))))
+        return (0.0, 0)
+    if store == "whitelist":
+        return ()
+    return (value,)
+
+
+def _row_bytes(rows: Iterable[tuple]) -> int:
+    """估算写入的行的大小：文本按UTF-8长度，数值按8字节计（与SQLite记录中的存储大小相当）"""
+    return sum(len(field.encode("utf-8")) if isinstance(field, str) else 8
+               for row in rows for field in row if field is not None)
+
+
+def _decode(store: str, row: tuple) -> Any:
+    """将表字段转换为内存中的值"""
+    if store in ("blacklist", "session_blacklist"):
+        return {"timestamp": row[0], "auto_added": bool(row[1])}
+    if store == "whitelist":
+        return True
+    return row[0]
+
+
+class SqliteBackend(StorageBackend):
+    """SQLite 存储后端（WAL 模式，按行增量写入）
+
+    track_changes 为 True 时启用共享模式，此后所有打开该数据库的实例都会记录修改
+    """
+
+    supports_partial_load = True
+
+    def __init__(self, db_path: Path, track_changes: bool = False):
+        self.db_path = Path(db_path)
+        self.created = not self.db_path.exists()
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.db_path), isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        # 多进程共用数据库时等待其他进程的写事务
+        self.conn.execute("PRAGMA busy_timeout=10000")
+        self.conn.executescript(_SCHEMA)
+        self.origin = uuid.uuid4().hex  # 本实例写入的修改记录来源
+        self.track_changes = self._init_change_log(track_changes)
+        self._last_prune = 0.0
+        self._data_version = self._current_data_version()
+
+    def _init_change_log(self, enable: bool) -> bool:
+        """创建修改记录表并记录到数据库中；数据库已启用共享模式时，未配置共享的实例也记录修改"""
+        if not enable:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = 'track_changes'").fetchone()
+            enable = bool(row and row[0])
+        if enable:
+            self.conn.executescript(_CHANGE_LOG_SCHEMA)
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('track_changes', 1)")
+            self._last_seq = self._max_seq()
+        return enable
+
+    def _max_seq(self) -> int:
+        return self.conn.execute("SELECT COALESCE(MAX(seq), 0) FROM change_log").fetchone()[0]
+
+    def _current_data_version(self) -> int:
+        """其他连接提交修改后 data_version 会变化"""
+        return self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def load(self, store: str) -> Dict[str, Any]:
+        table, columns = _TABLES[store]
+        fields = ", ".join(("session_id", "user_id") + columns)
+        result: Dict[str, Any] = {}
+        if store in SESSION_STORES:
+            rows = self.conn.execute(f"SELECT {fields} FROM {table} WHERE session_id != ''")
+            for row in rows:
+                result.setdefault(row[0], {})[row[1]] = _decode(store, row[2:])
+        else:
+            rows = self.conn.execute(f"SELECT {fields} FROM {table} WHERE session_id = ''")
+            for row in rows:
+                result[row[1]] = _decode(store, row[2:])
+        self._data_version = self._current_data_version()
+        return result
+
+    def load_session(self, store: str, session_id: str) -> Dict[str, Any]:
+        table, columns = _TABLES[store]
+        rows = self.conn.execute(
+            f"SELECT user_id, {', '.join(columns)} FROM {table} WHERE session_id = ?", (session_id,))
+        return {row[0]: _decode(store, row[1:]) for row in rows}
+
+    def session_ids(self, store: str) -> Set[str]:
+        table, _ = _TABLES[store]
+        ids = {row[0] for row in self.conn.execute(f"SELECT DISTINCT session_id FROM {table} WHERE session_id != ''")}
+        self._data_version = self._current_data_version()
+        return ids
+
+    def iter_sessions(self, store: str) -> Iterable[tuple]:
+        table, columns = _TABLES[store]
+        rows = self.conn.execute(
+            f"SELECT session_id, user_id, {', '.join(columns)} FROM {table} WHERE session_id != '' ORDER BY session_id")
+        for session_id, group in itertools.groupby(rows, key=lambda row: row[0]):
+            yield session_id, {row[1]: _decode(store, row[2:]) for row in group}
+
+    def changed_stores(self) -> Set[str]:
+        version = self._current_data_version()
+        if version == self._data_version:
+            return set()
+        self._data_version = version
+        return set(STORES)
+
+    def changed_entries(self) -> Dict[str, Optional[Dict[Any, Any]]]:
+        if not self.track_changes:
+            return super().changed_entries()
+        version = self._current_data_version()
+        if version == self._data_version:
+            return {}
+        self._data_version = version
+        # 修改记录与条目的值在同一个读事务中读取
+        self.conn.execute("BEGIN")
+        try:
+            return self._read_changes()
+        finally:
+            self.conn.execute("COMMIT")
+
+    def _read_changes(self) -> Dict[str, Optional[Dict[Any, Any]]]:
+        """读取其他实例的修改记录及对应条目的当前值"""
+        last_seq, self._last_seq = self._last_seq, self._max_seq()
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'pruned_seq'").fetchone()
+        if row and row[0] > last_seq:
+            # 需要的修改记录已被清理
+            return dict.fromkeys(STORES)
+        keys: Dict[str, Optional[Set[Any]]] = {}
+        rows = self.conn.execute(
+            "SELECT store, session_id, user_id FROM change_log WHERE seq > ? AND seq <= ? AND origin != ?",
+            (last_seq, self._last_seq, self.origin))
+        for store, session_id, user_id in rows:
+            if store not in keys:
+                keys[store] = set()
+            elif keys[store] is None:
+                continue
+            if session_id is None or len(keys[store]) >= MAX_PATCH_ENTRIES:
+                keys[store] = None
+            else:
+                keys[store].add((session_id, user_id) if store in SESSION_STORES else user_id)
+        changes: Dict[str, Optional[Dict[Any, Any]]] = {}
+        for store, store_keys in keys.items():
+            changes[store] = None if store_keys is None else {key: self._read_entry(store, key) for key in store_keys}
+        return changes
+
+    def _read_entry(self, store: str, key: Any) -> Any:
+        """条目的当前值，会话数据的用户ID为None时返回整个会话"""
+        session_id, user_id = key if store in SESSION_STORES else ("", key)
+        if user_id is None:
+            return self.load_session(store, session_id)
+        table, columns = _TABLES[store]
+        row = self.conn.execute(
+            f"SELECT 1{''.join(', ' + c for c in columns)} FROM {table} WHERE session_id = ? AND user_id = ?",
+            (session_id, user_id)).fetchone()
+        return DELETED if row is None else _decode(store, row[1:])
+
+    def invalidate(self, store: str):
+        self._data_version = None
+
+    def snapshot(self, store: str, data: Dict[str, Any], keys: DirtyKeys, deltas: Deltas = None) -> Any:
+        # 快照为 (需清空的范围, 需写入的行, 需删除的键, 增量写入的行)，只包含脏数据键对应的行
+        session_scoped = store in SESSION_STORES
+        if keys is None:
+            if session_scoped:
+                rows = [(sid, uid) + _encode(store, v) for sid, users in data.items() for uid, v in users.items()]
+            else:
+                rows = [("", uid) + _encode(store, v) for uid, v in data.items()]
+            return ("all", rows, [], [])
+
+        deltas = deltas or {}
+        cleared = {key[0] for key in keys if key[1] is None} if session_scoped else set()
+        clear_sessions, rows, deletes, adds = list(cleared), [], [], []
+        for key in keys:
+            if session_scoped:
+                sid, uid = key
+                users = data.get(sid, {})
+                if uid is None:
+                    # 整个会话重写
+                    rows.extend((sid, u) + _encode(store, v) for u, v in users.items())
+                    continue
+                if sid in cleared:
+                    continue
+            else:
+                sid, uid, users = "", key, data
+            if key in deltas:
+                change, low, high = deltas[key]
+                adds.append((sid, uid, apply_delta(None, deltas[key]), low, high, change))
+            elif uid in users:
+                rows.append((sid, uid) + _encode(store, users[uid]))
+            else:
+                deletes.append((sid, uid))
+        return (clear_sessions, rows, deletes, adds)
+
+    def write(self, changes: Dict[str, Any], events: List[Dict[str, Any]] = (), committed: Set[str] = None):
+        # 所有修改在同一个事务中提交
+        cur = self.conn.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        try:
+            for store, payload in changes.items():
+                self._write_store(cur, store, payload)
+                if self.track_changes:
+                    self._log_changes(cur, store, payload)
+            if self.track_changes:
+                self._prune_change_log(cur)
+            cur.execute("COMMIT")
+        except BaseException:
+            cur.execute("ROLLBACK")
+            raise
+        if committed is not None:
+            committed.update(changes)
+        if not self.track_changes:
+            self._data_version = self._current_data_version()
+
+    def _log_changes(self, cur: sqlite3.Cursor, store: str, payload: tuple):
+        """追加本次写入修改的键
+
+        增量写入的结果可能包含其他实例的修改，以空来源记录，本实例也会重新读取合并后的值
+        """
+        clear, rows, deletes, adds = payload
+        now = time.time()
+        sql = "INSERT INTO change_log (t, origin, store, session_id, user_id) VALUES (?, ?, ?, ?, ?)"
+        if clear == "all":
+            cur.execute(sql, (now, self.origin, store, None, None))
+            return
+        cur.executemany(sql, ((now, self.origin, store, sid, None) for sid in clear))
+        cleared = set(clear)
+        cur.executemany(sql, ((now, self.origin, store, key[0], key[1])
+                              for key in [row[:2] for row in rows] + list(deletes) if key[0] not in cleared))
+        cur.executemany(sql, ((now, "", store, row[0], row[1]) for row in adds))
+
+    def _prune_change_log(self, cur: sqlite3.Cursor):
+        """定期清理超过保留时间的修改记录，并记下清理到的序号"""
+        now = time.time()
+        if now - self._last_prune < CHANGE_LOG_PRUNE_INTERVAL:
+            return
+        self._last_prune = now
+        pruned = cur.execute("SELECT MAX(seq) FROM change_log WHERE t < ?", (now - CHANGE_LOG_RETENTION,)).fetchone()[0]
+        if pruned is not None:
+            cur.execute("DELETE FROM change_log WHERE seq <= ?", (pruned,))
+            cur.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('pruned_seq', ?)", (pruned,))
+
+    def _write_store(self, cur: sqlite3.Cursor, store: str, payload: tuple):
+        """写入一类数据的快照"""
+        table, columns = _TABLES[store]
+        clear, rows, deletes, adds = payload
+        if clear == "all":
+            condition = "session_id != ''" if store in SESSION_STORES else "session_id = ''"
+            cur.execute(f"DELETE FROM {table} WHERE {condition}")
+        else:
+            cur.executemany(f"DELETE FROM {table} WHERE session_id = ?", ((sid,) for sid in clear))
+        cur.executemany(f"DELETE FROM {table} WHERE session_id = ? AND user_id = ?", deletes)
+        self.records_written += len(rows) + len(deletes)
+        self.bytes_written += _row_bytes(rows) + _row_bytes(deletes)
+        cur.executemany(
+            f"INSERT OR REPLACE INTO {table} (session_id, user_id{''.join(', ' + c for c in columns)}) "
+            f"VALUES (?, ?{', ?' * len(columns)})",
+            rows,
+        )
+        # 增量写入在同一个写事务中累加到当前值上，上下限为NULL时不限制
+        if not adds:
+            return
+        self.records_written += len(adds)
+        self.bytes_written += _row_bytes(add[:3] for add in adds)
+        cur.executemany(
+            f"INSERT INTO {table} (session_id, user_id, value) VALUES (?1, ?2, ?3) "
+            "ON CONFLICT (session_id, user_id) DO UPDATE SET "
+            "value = MAX(COALESCE(?4, value + ?6), MIN(COALESCE(?5, value + ?6), value + ?6))",
+            adds,
+        )
+
+    def close(self):
+        self.conn.close()
+
+
+class JournalBackend(StorageBackend):
+    """追加日志存储后端
+
+    每次修改以一行 JSON 追加到 favor_events.jsonl，写入代价与数据总量无关；
+    日志同时记录好感度变化、拉黑等审计事件。启动时从快照（与 JsonBackend 相同的
+    JSON 文件）加载后重放日志；日志达到一定条数后在后台压缩为新快照。
+
+    日志记录格式：
+    - 数据修改：{"t": 时间, "s": 数据类型, "g": 会话ID, "k": 用户ID, "v": 值}，删除时为 "d": 1 且没有 "v"，
+      "k" 缺省表示整个会话，"g" 和 "k" 都缺省表示整类数据；增量修改为 "a": [变化量, 下限, 上限]，
+      重放时累加到当时的值上
+    - 审计事件：{"t": 时间, "e": 事件类型, ...}，重放时忽略
+    """
+
+    records_events = True
+    LOG_NAME = "favor_events.jsonl"
+
+    def __init__(self, data_path: Path, compact_records: int = 10000):
+        self.data_path = Path(data_path)
+        self.compact_records = compact_records
+        self.snapshots = JsonBackend(self.data_path)
+        self.log_path = self.data_path / self.LOG_NAME
+        self._lock = self.snapshots._lock
+        self._log_records = 0
+        self._log_signature = None
+
+    def _signature(self) -> Optional[tuple]:
+        try:
+            st = os.stat(self.log_path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def load(self, store: str) -> Dict[str, Any]:
+        return self.load_many([store])[store]
+
+    def load_many(self, stores: Iterable[str], until: float = None) -> Dict[str, Dict[str, Any]]:
+        """从快照加载并重放日志，until不为空时只重放该时间之前的记录（时间点恢复）"""
+        stores = list(stores)
+        with self._lock.hold():
+            state = {store: self.snapshots.load(store) for store in stores}
+            self._log_signature = self._signature()
+            self._log_records = 0
+            for record in self.read_log():
+                self._log_records += 1
+                if until is not None and record.get("t", 0) > until:
+                    continue
+                if record.get("s") in state:
+                    self._apply(state[record["s"]], record)
+        return state
+
+    def read_log(self) -> Iterable[Dict[str, Any]]:
+        """逐条读取日志，忽略末尾写入不完整的记录"""
+        if not self.log_path.exists():
+            return
+        with open(self.log_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+    @staticmethod
+    def _apply(data: Dict[str, Any], record: Dict[str, Any]):
+        """把一条数据修改记录应用到数据上"""
+        if "g" not in record and "k" not in record:
+            data.clear()
+            data.update(record.get("v", {}))
+            return
+        if "g" in record:
+            if "k" not in record:
+                if record.get("d"):
+                    data.pop(record["g"], None)
+                else:
+                    data[record["g"]] = dict(record["v"])
+                return
+            data = data.setdefault(record["g"], {})
+        if record.get("d"):
+            data.pop(record["k"], None)
+        elif "a" in record:
+            data[record["k"]] = apply_delta(data.get(record["k"]), tuple(record["a"]))
+        else:
+            data[record["k"]] = record["v"]
+
+    def changed_stores(self) -> Set[str]:
+        changed = self.snapshots.changed_stores()
+        if self._signature() != self._log_signature:
+            return set(STORES)
+        return changed
+
+    def invalidate(self, store: str):
+        self._log_signature = None
+
+    def snapshot(self, store: str, data: Dict[str, Any], keys: DirtyKeys, deltas: Deltas = None) -> Any:
+        # 快照为待追加的记录（不含时间，写入时补上）
+        if keys is None:
+            return [{"s": store, "v": self.snapshots.snapshot(store, data, None)[1]}]
+        deltas = deltas or {}
+        cleared = {key[0] for key in keys if key[1] is None} if store in SESSION_STORES else set()
+        records = []
+        for key in keys:
+            if store in SESSION_STORES:
+                sid, uid = key
+                if uid is None:
+                    users = data.get(sid)
+                    records.append({"s": store, "g": sid, "v": dict(users)} if users is not None else {"s": store, "g": sid, "d": 1})
+                    continue
+                if sid in cleared:
+                    continue
+                record, users = {"s": store, "g": sid, "k": uid}, data.get(sid, {})
+            else:
+                record, users, uid = {"s": store, "k": key}, data, key
+            if key in deltas:
+                record["a"] = list(deltas[key])
+            elif uid in users:
+                value = users[uid]
+                record["v"] = dict(value) if isinstance(value, Mapping) else value
+            else:
+                record["d"] = 1
+            records.append(record)
+        return records
+
+    def write(self, changes: Dict[str, Any], events: List[Dict[str, Any]] = (), committed: Set[str] = None):
+        # 数据修改和审计事件在一次追加中写入
+        now = time.time()
+        lines = []
+        for records in changes.values():
+            for record in records:
+                record["t"] = now
+                lines.append(json.dumps(record, ensure_ascii=False, separators=(",", ":")))
+        lines.extend(json.dumps(event, ensure_ascii=False, separators=(",", ":")) for event in events)
+        if not lines:
+            if committed is not None:
+                committed.update(changes)
+            return
+        payload = ("\n".join(lines) + "\n").encode("utf-8")
+        with self._lock.hold():
+            external = self._signature() != self._log_signature
+            with open(self.log_path, "ab") as f:
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+            if committed is not None:
+                committed.update(changes)
+                if events:
+                    committed.add(EVENTS)
+            self._log_records += len(lines)
+            self.bytes_written += len(payload)
+            self.records_written += len(lines)
+            # 其他进程追加过日志时保留旧签名，下次刷新时重新加载
+            if not external:
+                self._log_signature = self._signature()
+
+    def needs_compaction(self) -> bool:
+        return self._log_records >= self.compact_records
+
+    def compact(self, state: Dict[str, Dict[str, Any]]):
+        """把完整数据写为新快照并清空日志；快照写完前崩溃时重放日志仍能得到正确结果"""
+        with self._lock.hold():
+            if self._signature() != self._log_signature:
+                # 其他进程追加了尚未加载的记录，下次再压缩
+                return
+            written = self.snapshots.bytes_written
+            for store, data in state.items():
+                self.snapshots._write_file(data, store)
+            self.bytes_written += self.snapshots.bytes_written - written
+            tmp_path = self.log_path.with_name(self.log_path.name + ".tmp")
+            open(tmp_path, "w").close()
+            os.replace(tmp_path, self.log_path)
+            self._log_records = 0
+            self._log_signature = self._signature()
+
+    def restore(self, until: float) -> Dict[str, Dict[str, Any]]:
+        """恢复到指定时间点（不早于上次压缩）：以该时间之前的日志生成新快照，原日志另存为备份"""
+        with self._lock.hold():
+            state = self.load_many(STORES, until=until)
+            if self.log_path.exists():
+                os.replace(self.log_path, self.log_path.with_name(f"{self.log_path.name}.{int(time.time())}.bak"))
+            self._log_signature = self._signature()
+            self.compact(state)
+        return state
+
+    def history(self, user_id: str) -> List[Dict[str, Any]]:
+        """某个用户的审计事件"""
+        return [record for record in self.read_log() if "e" in record and record.get("uid") == user_id]
+
+
+def create_backend(kind: str, data_path: Path, **options) -> StorageBackend:
+    """根据配置创建存储后端，首次启用SQLite时自动从JSON文件迁移
+
+    options 中 shared_path 不为空时使用多实例共享的 SQLite 数据库
+    """
+    data_path = Path(data_path)
+    if options.get("shared_path"):
+        backend = SqliteBackend(Path(options["shared_path"]), track_changes=True)
+        if backend.created:
+            migrate_json_to_sqlite(data_path, backend)
+        return backend
+    if kind == "sqlite":
+        backend = SqliteBackend(data_path / "favor.db")
+        if backend.created:
+            migrate_json_to_sqlite(data_path, backend)
+        return backend
+    if kind == "journal":
+        return JournalBackend(data_path, options.get("compact_records", 10000))
+    return JsonBackend(data_path)
+
+
+def migrate_json_to_sqlite(json_dir: Path, target) -> int:
+    """将JSON文件中的数据一次性导入SQLite，返回导入的数据类型数量"""
+    source = JsonBackend(json_dir)
+    backend = target if isinstance(target, SqliteBackend) else SqliteBackend(Path(target))
+    changes = {}
+    for store in STORES:
+        if source._path(store).exists():
+            changes[store] = backend.snapshot(store, source.load(store), None)
+    if changes:
+        backend.write(changes)
+    if backend is not target:
+        backend.close()
+    return len(changes)
+
+
+def _main(argv: Iterable[str]) -> int:
+    args = list(argv)
+    if len(args) >= 2 and args[0] == "migrate":
+        json_dir = Path(args[1])
+        db_path = Path(args[2]) if len(args) > 2 else json_dir / "favor.db"
+        count = migrate_json_to_sqlite(json_dir, db_path)
+        print(f"已将 {count} 类数据从 {json_dir} 迁移到 {db_path}")
+        return 0
+    if len(args) == 3 and args[0] == "history":
+        for record in JournalBackend(Path(args[1])).history(args[2]):
+            print(json.dumps(record, ensure_ascii=False))
+        return 0
+    if len(args) == 3 and args[0] == "restore":
+        JournalBackend(Path(args[1])).restore(float(args[2]))
+        print(f"已将 {args[1]} 中的数据恢复到 {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(float(args[2])))}")
+        return 0
+    print(__doc__)
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(_main(sys.argv[1:]))